@@ -0,0 +1,162 @@
+"""
+Benchmark the post-processing hot paths of OptiPRISMS on synthetic data, for several numbers of points.
+
+For each function, the duration of the first call (cold caches), the best duration over the next calls and the peak
+memory allocated by Python during a cold call (tracemalloc) are reported. The results can be saved as JSON and compared
+against a previous run, e.g.:
+
+    python run_benchmarks.py --sizes 1e3 1e4 1e5 --output before.json
+    python run_benchmarks.py --sizes 1e3 1e4 1e5 --compare before.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import triangulate  # noqa: E402
+import vtk_utils  # noqa: E402
+from ComputeCostFunctions import ExperimentalDataset, compute_weighted_cost  # noqa: E402
+from synthetic import make_case  # noqa: E402
+
+
+def clear_caches(data=None):
+    """
+    Empty the in-memory caches used by the benchmarked functions, so that the next call is a cold one.
+
+    Parameters
+    ----------
+    data : ComputeCostFunctions.ExperimentalDataset, optional
+        Dataset whose cached normalizations are cleared too. The default is None.
+    """
+    triangulate._projection_cache.clear()
+    triangulate._triangulation_cache.clear()
+    vtk_utils._surface_indices.clear()
+    if data is not None:
+        data._normalizations.clear()
+
+
+def measure(func, repeat, data=None):
+    """
+    Measure the duration and the peak memory of a function.
+
+    Parameters
+    ----------
+    func : callable
+        Function to call, without arguments
+    repeat : int
+        Number of calls after the first one
+    data : ComputeCostFunctions.ExperimentalDataset, optional
+        Dataset used by the function, whose caches are cleared before cold calls. The default is None.
+
+    Returns
+    -------
+    dict
+        Duration of the first call, best duration of the next calls (in seconds) and peak memory of a cold call (in
+        MB)
+    """
+    clear_caches(data)
+    first = timeit.timeit(func, number=1)
+
+    # Memory is traced during another cold call, since tracing slows down allocations
+    clear_caches(data)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    best = min(timeit.repeat(func, number=1, repeat=repeat)) if repeat else first
+    return {'first (s)': first, 'best (s)': best, 'peak memory (MB)': peak / 1e6}
+
+
+def benchmarks(folder, n_points, n_pieces):
+    """
+    Generate a synthetic case, and return the functions to benchmark on it.
+
+    Parameters
+    ----------
+    folder : str
+        Folder where the synthetic case is written
+    n_points : int
+        Number of nodes on the surface, and of DIC points per step
+    n_pieces : int
+        Number of pieces of each pvtu file
+
+    Returns
+    -------
+    dict
+        Functions to benchmark (without arguments), indexed by name
+    ComputeCostFunctions.ExperimentalDataset
+        Dataset of the synthetic case
+    """
+    config, result_folder = make_case(folder, n_points, n_pieces=n_pieces)
+    data = ExperimentalDataset(config)
+    pvtu_file = os.path.join(result_folder, 'solution-{:04}.pvtu'.format(data.dic_time_steps[0]))
+    nodes, u_sim = vtk_utils.read_pvtu(pvtu_file)
+    pts_dic = np.ascontiguousarray(data.dic_steps[0][:, :2])
+    funcs = {'read_pvtu': lambda: vtk_utils.read_pvtu(pvtu_file),
+             'matrix_projection': lambda: triangulate.matrix_projection(nodes, pts_dic),
+             'triangular_projection': lambda: triangulate.triangular_projection(nodes, u_sim, pts_dic, cache=True),
+             'compute_weighted_cost': lambda: compute_weighted_cost(result_folder, data)}
+    try:
+        from orix.quaternion import Orientation
+        from orix.quaternion.symmetry import Oh
+    except ImportError:
+        print('orix is not installed: project_orientation is skipped.')
+    else:
+        orientations = Orientation.random(len(nodes), symmetry=Oh)
+        funcs['project_orientation'] = lambda: triangulate.project_orientation(nodes, orientations, pts_dic)
+    return funcs, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the post-processing functions of OptiPRISMS on '
+                                                 'synthetic data.')
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1e3, 1e4, 1e5],
+                        help='Numbers of points (default: 1e3 1e4 1e5)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of warm calls of each function (default: 3)')
+    parser.add_argument('--pieces', type=int, default=4, help='Number of pieces of pvtu files (default: 4)')
+    parser.add_argument('--only', nargs='+', help='Names of the functions to benchmark (default: all)')
+    parser.add_argument('--output', help='JSON file where the results are saved')
+    parser.add_argument('--compare', help='JSON file of a previous run, to compare against')
+    parser.add_argument('--workdir', help='Folder where the synthetic data are written (default: temporary folder)')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    print('{:<24}{:>10}{:>12}{:>12}{:>14}{:>10}'.format('Function', 'Points', 'First (s)', 'Best (s)',
+                                                       'Memory (MB)', 'Speedup'))
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        for size in args.sizes:
+            n_points = int(size)
+            funcs, data = benchmarks(os.path.join(workdir, str(n_points)), n_points, args.pieces)
+            for name, func in funcs.items():
+                if args.only and name not in args.only:
+                    continue
+                key = '{}[{}]'.format(name, n_points)
+                results[key] = measure(func, args.repeat, data=data)
+                if key in baseline:
+                    speedup = '{:.2f}x'.format(baseline[key]['best (s)'] / results[key]['best (s)'])
+                else:
+                    speedup = ''
+                print('{:<24}{:>10}{:>12.4f}{:>12.4f}{:>14.1f}{:>10}'.format(
+                    name, n_points, results[key]['first (s)'], results[key]['best (s)'],
+                    results[key]['peak memory (MB)'], speedup))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
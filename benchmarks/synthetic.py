@@ -0,0 +1,193 @@
+"""
+Generate synthetic PRISMS-Plasticity outputs (multi-piece pvtu files and stressstrain.txt) and experimental data (DIC
+and tensile curve), so that the post-processing functions can be benchmarked without running PRISMS-Plasticity.
+"""
+import configparser
+import os
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk
+
+# Size of the region of interest
+LX, LY, LZ = 1000., 500., 50.
+
+
+def surface_grid(n_nodes, seed=0):
+    """
+    Generate a structured grid of about n_nodes nodes on the surface of interest. The interior nodes are slightly
+    shifted, so that the Delaunay triangulation is not degenerate.
+
+    Parameters
+    ----------
+    n_nodes : int
+        Requested number of nodes
+    seed : int, optional
+        Seed of the random generator. The default is 0.
+
+    Returns
+    -------
+    numpy.ndarray
+        n x 2 array of node coordinates
+    """
+    nx = max(int(round(np.sqrt(n_nodes * LX / LY))), 2)
+    ny = max(int(round(n_nodes / nx)), 2)
+    x, y = np.meshgrid(np.linspace(0., LX, nx), np.linspace(0., LY, ny), indexing='ij')
+    rng = np.random.default_rng(seed)
+    x[1:-1, 1:-1] += rng.uniform(-0.2, 0.2, (nx - 2, ny - 2)) * LX / nx
+    y[1:-1, 1:-1] += rng.uniform(-0.2, 0.2, (nx - 2, ny - 2)) * LY / ny
+    return np.column_stack((x.ravel(), y.ravel()))
+
+
+def displacement(pts, step):
+    """Smooth displacement field at given points (n x 3), for a given step."""
+    x, y = pts[:, 0], pts[:, 1]
+    scale = 0.01 * (step + 1)
+    return np.column_stack((scale * x + np.sin(y / 50.), -0.3 * scale * y + np.cos(x / 50.),
+                            np.zeros(len(pts)) if pts.shape[1] == 2 else -0.3 * scale * pts[:, 2]))
+
+
+def write_pvtu(folder, surface_nodes, step, n_pieces=4, n_layers=2, seed=0):
+    """
+    Write a multi-piece pvtu file (solution-XXXX.pvtu), as written by PRISMS-Plasticity. The pieces are slices along x,
+    whose boundary nodes are duplicated. The nodes of each piece are shuffled.
+
+    Parameters
+    ----------
+    folder : str
+        Results folder
+    surface_nodes : numpy.ndarray
+        n x 2 array of node coordinates on the surface of interest (z=0)
+    step : int
+        Increment number
+    n_pieces : int, optional
+        Number of pieces. The default is 4.
+    n_layers : int, optional
+        Number of layers of nodes along z. The default is 2.
+    seed : int, optional
+        Seed of the random generator. The default is 0.
+
+    Returns
+    -------
+    str
+        Path to the pvtu file
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    z = np.linspace(0., LZ, n_layers)
+    pts = np.column_stack((np.tile(surface_nodes, (n_layers, 1)), np.repeat(z, len(surface_nodes))))
+    u = displacement(pts, step)
+    bounds = np.linspace(0., LX, n_pieces + 1)
+    sources = []
+    for k in range(n_pieces):
+        ids = np.flatnonzero((pts[:, 0] >= bounds[k] - 1e-9) & (pts[:, 0] <= bounds[k + 1] + 1e-9))
+        rng.shuffle(ids)
+        grid = vtk.vtkUnstructuredGrid()
+        points = vtk.vtkPoints()
+        points.SetData(numpy_to_vtk(pts[ids].astype(np.float32), deep=True))
+        grid.SetPoints(points)
+        array = numpy_to_vtk(u[ids].astype(np.float32), deep=True)
+        array.SetName('Displacement')
+        grid.GetPointData().AddArray(array)
+        source = 'solution-{:04}.{}.vtu'.format(step, k)
+        writer = vtk.vtkXMLUnstructuredGridWriter()
+        writer.SetFileName(os.path.join(folder, source))
+        writer.SetInputData(grid)
+        writer.Write()
+        sources.append(source)
+    pvtu_file = os.path.join(folder, 'solution-{:04}.pvtu'.format(step))
+    with open(pvtu_file, 'w') as f:
+        f.write('<?xml version="1.0"?>\n')
+        f.write('<VTKFile type="PUnstructuredGrid" version="0.1">\n<PUnstructuredGrid GhostLevel="0">\n')
+        f.write('<PPointData><PDataArray type="Float32" Name="Displacement" NumberOfComponents="3"/></PPointData>\n')
+        for source in sources:
+            f.write('<Piece Source="{}"/>\n'.format(source))
+        f.write('</PUnstructuredGrid>\n</VTKFile>\n')
+    return pvtu_file
+
+
+def write_dic(csv_file, n_points, step, seed=0):
+    """
+    Write DIC measurements (x, y, ux, uy, correlation coefficient) at n_points random locations.
+
+    Parameters
+    ----------
+    csv_file : str
+        Path to CSV file
+    n_points : int
+        Number of DIC points
+    step : int
+        Increment number of the related simulated step
+    seed : int, optional
+        Seed of the random generator. The default is 0.
+    """
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform((0., 0.), (LX, LY), (n_points, 2))
+    u = displacement(xy, step)[:, :2] + rng.normal(0., 0.01, (n_points, 2))
+    c = rng.uniform(0.01, 0.1, n_points)
+    np.savetxt(csv_file, np.column_stack((xy, u, c)))
+
+
+def write_tensile_curve(txt_file, n_points=200):
+    """Write an experimental tensile curve (elongation, stress)."""
+    elon = np.linspace(0., 0.1, n_points)
+    np.savetxt(txt_file, np.column_stack((elon, 400. * np.tanh(100. * elon))), delimiter='\t')
+
+
+def write_stressstrain(folder, n_increments):
+    """Write the stressstrain.txt file of a simulation, with one line per increment."""
+    os.makedirs(folder, exist_ok=True)
+    exx = np.linspace(0., 0.1, n_increments + 1)
+    txx = 390. * np.tanh(110. * exx)
+    zeros = np.zeros_like(exx)
+    columns = ['Exx', 'Eyy', 'Ezz', 'Eyz', 'Exz', 'Exy', 'Txx', 'Tyy', 'Tzz', 'Tyz', 'Txz', 'Txy']
+    values = np.column_stack((exx, -0.3 * exx, -0.3 * exx, zeros, zeros, zeros, txx, zeros, zeros, zeros, zeros, zeros))
+    np.savetxt(os.path.join(folder, 'stressstrain.txt'), values, delimiter='\t', header='\t'.join(columns),
+               comments='')
+
+
+def make_case(folder, n_points, n_steps=2, n_pieces=4, n_increments=1000, seed=0):
+    """
+    Write a complete synthetic case: simulation results, DIC measurements and tensile curve, with about n_points
+    nodes on the surface of interest and n_points DIC points per step.
+
+    Parameters
+    ----------
+    folder : str
+        Folder where the case is written
+    n_points : int
+        Number of nodes on the surface, and of DIC points per step
+    n_steps : int, optional
+        Number of DIC steps. The default is 2.
+    n_pieces : int, optional
+        Number of pieces of each pvtu file. The default is 4.
+    n_increments : int, optional
+        Number of lines of the stressstrain.txt file. The default is 1000.
+    seed : int, optional
+        Seed of the random generator. The default is 0.
+
+    Returns
+    -------
+    configparser.ConfigParser
+        Configuration data describing the case (as used by ComputeCostFunctions.ExperimentalDataset)
+    str
+        Results folder of the simulation
+    """
+    result_folder = os.path.join(folder, 'results')
+    nodes = surface_grid(n_points, seed=seed)
+    time_steps = [(step + 1) * n_increments // n_steps - 1 for step in range(n_steps)]
+    for step, step_simu in enumerate(time_steps):
+        write_pvtu(result_folder, nodes, step_simu, n_pieces=n_pieces, seed=seed + step)
+        write_dic(os.path.join(folder, 'DIC_{}.csv'.format(step + 1)), n_points, step_simu, seed=seed + step)
+    write_stressstrain(result_folder, n_increments)
+    write_tensile_curve(os.path.join(folder, 'TensileCurve.txt'))
+
+    config = configparser.ConfigParser()
+    config.read_dict({'Experimental Data': {'DIC data': os.path.join(folder, 'DIC_'),
+                                            'DIC time steps': ', '.join(map(str, time_steps)),
+                                            'tensile curve': os.path.join(folder, 'TensileCurve.txt')},
+                      'Cost Function': {'weight on tensile curve': '0.5',
+                                        'penalty': '5',
+                                        'weight by correlation coefficients': 'Yes'},
+                      'Log File': {'file path': os.path.join(folder, 'log.csv')}})
+    return config, result_folder
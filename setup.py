@@ -22,4 +22,7 @@ setup(
         'pandas',
         'optimparallel'
     ],
+    entry_points={
+        'console_scripts': ['optiprisms-postprocess=PostProcess:main'],
+    },
 )
@@ -0,0 +1,298 @@
+import configparser
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from ComputeCostFunctions import ExperimentalDataset, batch_kine_cost, read_displacements, simulated_curve
+from costFunctions import pad_steps, weighted_cost_function
+from Experiments import combine_costs, experiment_name, read_experiments
+from io_utils import atomic_write, read_stressstrain
+
+# Node table shared by all the archived evaluations
+NODES_FILE = 'nodes.npy'
+
+
+class ResultArchive:
+    """
+    Compact archive of the results of the simulations: for each evaluation, only the displacements of the surface nodes
+    at the DIC steps and the stress-strain curve are kept, in a compressed npz file named after the index of the related
+    row in the log file. The fields are stored as float32. The node coordinates are stored once for all, since the mesh
+    does not change between simulations.
+
+    Parameters
+    ----------
+    folder : str
+        Folder of the archive
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._nodes = None
+        os.makedirs(folder, exist_ok=True)
+        nodes_file = os.path.join(folder, NODES_FILE)
+        if os.path.isfile(nodes_file):
+            self._nodes = np.load(nodes_file)
+
+    def file_path(self, row):
+        """Return the path to the archive of the evaluation written at a given row of the log file."""
+        return os.path.join(self.folder, 'row_{:06}.npz'.format(row))
+
+    def rows(self):
+        """Return the indices of the archived rows of the log file, in increasing order."""
+        rows = []
+        for file_path in glob.glob(os.path.join(self.folder, 'row_*.npz')):
+            match = re.fullmatch(r'row_(\d+)\.npz', os.path.basename(file_path))
+            if match:
+                rows.append(int(match.group(1)))
+        return sorted(rows)
+
+    @staticmethod
+    def extract(result_folder, data, displacements=None):
+        """
+        Read the results to archive from the results folder of a simulation.
+
+        Parameters
+        ----------
+        result_folder : str
+            Results folder of the simulation
+        data : ComputeCostFunctions.ExperimentalDataset
+            Experimental data, giving the DIC steps
+        displacements : tuple, optional
+            Nodes and displacements at each DIC step, as returned by ComputeCostFunctions.read_displacements, if they
+            have already been read for computing the cost function. The default is None (they are read again).
+
+        Returns
+        -------
+        dict
+            Surface nodes, displacements at each DIC step and stress-strain table. Missing results are skipped, and
+            flagged by the 'complete' item.
+        """
+        if displacements is None:
+            displacements = read_displacements(result_folder, data)
+        nodes_steps, u_steps, complete = displacements
+        fields = {'complete': np.array(complete)}
+        if nodes_steps:
+            fields['nodes'] = nodes_steps[-1]
+        for step, u_sim in enumerate(u_steps):
+            fields['u_{}'.format(step)] = u_sim
+        try:
+            stressstrain = read_stressstrain(result_folder + '/stressstrain.txt')
+            fields['stressstrain'] = stressstrain.to_numpy()
+            fields['stressstrain_columns'] = np.array(stressstrain.columns, dtype=str)
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            pass
+        return fields
+
+    def write(self, row, fields):
+        """
+        Write the results of an evaluation.
+
+        Parameters
+        ----------
+        row : int
+            Index of the related row in the log file
+        fields : dict
+            Results, as returned by extract()
+        """
+        arrays = {}
+        for key, value in fields.items():
+            if key == 'nodes':
+                continue
+            arrays[key] = value.astype(np.float32) if value.dtype.kind == 'f' else value
+        nodes = fields.get('nodes')
+        if nodes is not None:
+            if self._nodes is None:
+                self._write_nodes(nodes)
+            if not np.array_equal(nodes, self._nodes):
+                # The nodes do not match the shared table: keep them along with the displacements
+                arrays['nodes'] = nodes
+        with atomic_write(self.file_path(row)) as tmp_file:
+            np.savez_compressed(tmp_file, **arrays)
+
+    def _write_nodes(self, nodes):
+        nodes_file = os.path.join(self.folder, NODES_FILE)
+        if os.path.isfile(nodes_file):
+            # Written by another process in the meantime
+            self._nodes = np.load(nodes_file)
+            return
+        with atomic_write(nodes_file) as tmp_file:
+            np.save(tmp_file, nodes)
+        self._nodes = nodes
+
+    def read(self, row):
+        """
+        Read the results of an evaluation.
+
+        Parameters
+        ----------
+        row : int
+            Index of the related row in the log file
+
+        Returns
+        -------
+        numpy.ndarray or None
+            m x 2 array of surface nodes, or None if no displacement was archived
+        list of numpy.ndarray
+            Displacements (m x 3) at each DIC step
+        pandas.DataFrame or None
+            Stress-strain table, or None if it was not archived
+        bool
+            False if the simulation has failed before the last DIC step
+        """
+        with np.load(self.file_path(row)) as archive:
+            u_steps = []
+            while 'u_{}'.format(len(u_steps)) in archive:
+                u_steps.append(archive['u_{}'.format(len(u_steps))].astype(float))
+            nodes = archive['nodes'] if 'nodes' in archive else self._nodes
+            if 'stressstrain' in archive:
+                stressstrain = pd.DataFrame(archive['stressstrain'].astype(float),
+                                            columns=archive['stressstrain_columns'])
+            else:
+                stressstrain = None
+            complete = bool(archive['complete'])
+        if not u_steps:
+            nodes = None
+        return nodes, u_steps, stressstrain, complete
+
+    def compute_cost(self, row, data):
+        """
+        Compute the cost functions of an archived evaluation.
+
+        Parameters
+        ----------
+        row : int
+            Index of the related row in the log file
+        data : ComputeCostFunctions.ExperimentalDataset
+            Experimental data and cost function options
+
+        Returns
+        -------
+        dict
+            Kinematic, static and weighted cost functions
+        """
+        return self.compute_costs([row], data)[0]
+
+    def compute_costs(self, rows, data, chunk_size=64):
+        """
+        Compute the cost functions of many archived evaluations. The evaluations sharing the same mesh are processed
+        together, by chunks, so that the projections and cost functions are computed in a few vectorized passes.
+
+        Parameters
+        ----------
+        rows : list of int
+            Indices of the related rows in the log file
+        data : ComputeCostFunctions.ExperimentalDataset
+            Experimental data and cost function options
+        chunk_size : int, optional
+            Number of evaluations processed together. The default is 64.
+
+        Returns
+        -------
+        list of dict
+            Kinematic, static and weighted cost functions of each evaluation
+        """
+        costs = []
+        for start in range(0, len(rows), chunk_size):
+            results = [self.read(row) for row in rows[start:start + chunk_size]]
+            chi_u = np.full(len(results), data.penalty)
+            chi_f = np.full(len(results), data.penalty)
+
+            # Group the complete evaluations by mesh (most of them use the shared node table) and number of
+            # archived steps
+            groups = {}
+            for i, (nodes, u_steps, _, complete) in enumerate(results):
+                if complete and u_steps:
+                    groups.setdefault((id(nodes), len(u_steps)), []).append(i)
+            for (_, n_steps), ids in groups.items():
+                nodes = results[ids[0]][0]
+                u_steps = [np.stack([results[i][1][step] for i in ids]) for step in range(n_steps)]
+                chi_u[ids] = batch_kine_cost([nodes] * n_steps, u_steps, data)
+
+            ids = [i for i, result in enumerate(results) if result[2] is not None]
+            if ids:
+                curves = [simulated_curve(results[i][2], data) for i in ids]
+                elon_simu, mask = pad_steps([np.asarray(elon) for elon, _ in curves])
+                stress_simu, _ = pad_steps([np.asarray(stress) for _, stress in curves])
+                chi_f[ids] = data.tensile_curve.cost(elon_simu, stress_simu, mask=mask)
+
+            for u, f in zip(chi_u, chi_f):
+                chi = weighted_cost_function(f, u, w1=data.w_sigma)
+                costs.append({'chi_u': u, 'chi_f': f, 'chi': chi})
+        return costs
+
+
+def archive_folder(config):
+    """
+    Return the folder of the archive defined in the [Archive] section, or None if archiving is disabled.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data of an experiment (see Experiments.read_experiments)
+
+    Returns
+    -------
+    str or None
+        Folder of the archive
+    """
+    section = 'Archive'
+    if not (config.has_option(section, 'use archive') and config.getboolean(section, 'use archive')):
+        return None
+    if config.has_option(section, 'folder'):
+        folder = config[section]['folder']
+    else:
+        logfile = config['Log File']['file path']
+        folder = os.path.join(os.path.dirname(os.path.abspath(logfile)), 'archive')
+    name = experiment_name(config)
+    if name is not None:
+        # The meshes and DIC steps of different experiments cannot be mixed
+        folder = os.path.join(folder, name)
+    return folder
+
+
+def recompute_costs(config_file='Config.ini', output_file=None):
+    """
+    Recompute the cost functions of all the archived evaluations, without running any simulation. The experimental
+    data and the cost function options are read from the configuration file, so that they can differ from those used
+    during optimization (e.g. new weights, new DIC data or new tensile direction).
+
+    Parameters
+    ----------
+    config_file : str, optional
+        Path to configuration file. The default is 'Config.ini'.
+    output_file : str, optional
+        If given, the results are written in this CSV file. The default is None.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Parameters and new cost functions (with the same columns as the log file) of each archived evaluation, indexed
+        by the rows of the log file
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    param_names = list(config['Initial Guess'].keys())
+    log = pd.read_csv(config['Log File']['file path'])
+    experiments = read_experiments(config)
+    archives = []
+    for experiment in experiments:
+        folder = archive_folder(experiment.config)
+        if folder is None:
+            raise ValueError('Archiving is not enabled in {}.'.format(config_file))
+        archives.append((ResultArchive(folder), ExperimentalDataset(experiment.config)))
+
+    # Only the evaluations archived for every experiment can be recomputed
+    rows = sorted(set.intersection(*[set(archive.rows()) for archive, _ in archives]))
+    costs = [archive.compute_costs(rows, data) for archive, data in archives]
+    records = []
+    for row, chis in zip(rows, zip(*costs)):
+        values = [value for experiment, chi in zip(experiments, chis) for value in experiment.log_values(chi)]
+        records.append(list(log.loc[row, param_names]) + values + [combine_costs(experiments, chis)])
+    chi_names = [name for experiment in experiments for name in experiment.chi_names] + ['chi']
+    results = pd.DataFrame(records, index=rows, columns=param_names + chi_names)
+    if output_file is not None:
+        results.to_csv(output_file, index=False)
+    return results
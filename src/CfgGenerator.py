@@ -1,27 +1,273 @@
+import hashlib
+import os
+import shutil
+import socket
+import uuid
 from string import Template
 
+from Experiments import experiment_name
+
+
+# File written in each working directory, telling which process uses it
+LOCK_FILE = '.optiprisms.lock'
+
+# Variables defined by OptiPRISMS itself, which can be used in templates in addition to the optimized parameters
+RESERVED_KEYS = ('results', 'LH_name', 'restart', 'restart_folder', 'restart_step')
+
 
 def fileparser(inputfname, outputfname, d):
     with open(inputfname, 'r') as f:
         src = Template(f.read())
+    try:
+        result = src.substitute(d)
+    except KeyError as e:
+        raise KeyError('Key {} in {} is undefined.'.format(e.args[0], inputfname))
+    with open(outputfname, "w") as text_file:
+        text_file.write(result)
+
+
+def placeholders(template):
+    """
+    Return the names of the variables used in a template.
+
+    Parameters
+    ----------
+    template : string.Template
+        Template to parse
+
+    Returns
+    -------
+    set of str
+        Names of the variables (without the dollar symbol)
+    """
+    names = set()
+    for match in template.pattern.finditer(template.template):
+        name = match.group('named') or match.group('braced')
+        if name is not None:
+            names.add(name)
+    return names
+
+
+class TemplateSet:
+    """
+    Templates of the prm file and of the latent hardening ratio file, read and parsed once for all the simulations.
+
+    Parameters
+    ----------
+    prm_file : str
+        Path to the template of the prm file
+    lh_file : str
+        Path to the template of the latent hardening ratio file
+    """
+
+    def __init__(self, prm_file, lh_file):
+        self.files = (prm_file, lh_file)
+        self.templates = []
+        for template_file in self.files:
+            with open(template_file, 'r') as f:
+                self.templates.append(Template(f.read()))
+
+    @classmethod
+    def from_config(cls, config):
+        """Read the templates given in the [PRISMS] section of the configuration."""
+        return cls(config['PRISMS']['prm file'], config['PRISMS']['latent hardening ratio'])
+
+    def validate(self, param_names):
+        """
+        Check that the variables used in the templates are consistent with the optimized parameters.
+
+        Parameters
+        ----------
+        param_names : list of str
+            Names of the optimized parameters
+
+        Raises
+        ------
+        KeyError
+            If a template uses a variable which is neither an optimized parameter, nor a reserved variable
+        ValueError
+            If an optimized parameter is not used in any template
+        """
+        used = set()
+        for template_file, template in zip(self.files, self.templates):
+            names = placeholders(template)
+            for name in sorted(names):
+                if name not in param_names and name not in RESERVED_KEYS:
+                    raise KeyError('Key {} in {} is undefined.'.format(name, template_file))
+            used |= names
+        unused = [name for name in param_names if name not in used]
+        if unused:
+            raise ValueError('Parameter(s) {} not used in any template.'.format(', '.join(unused)))
+
+    def render(self, d, prm_name, lh_name):
+        """
+        Fill the templates with given values, and write the prm and the latent hardening ratio files.
+
+        Parameters
+        ----------
+        d : dict
+            Values of the variables
+        prm_name : str
+            Path to the prm file to write
+        lh_name : str
+            Path to the latent hardening ratio file to write
+        """
+        self.render_batch([(d, prm_name, lh_name)])
+
+    def render_batch(self, jobs):
+        """
+        Same as render, for many sets of values at once. All the files are rendered before being written.
+
+        Parameters
+        ----------
+        jobs : list of tuple
+            Values of the variables, path to the prm file and path to the latent hardening ratio file, for each
+            simulation
+        """
+        outputs = []
+        for d, prm_name, lh_name in jobs:
+            for template_file, template, output_file in zip(self.files, self.templates, (prm_name, lh_name)):
+                try:
+                    outputs.append((output_file, template.substitute(d)))
+                except KeyError as e:
+                    raise KeyError('Key {} in {} is undefined.'.format(e.args[0], template_file))
+        for output_file, text in outputs:
+            with open(output_file, 'w') as f:
+                f.write(text)
+
+
+def simulation_name(d, experiment=None):
+    # Short name of the simulation related to a set of parameters (and to an experiment, if many are used). The
+    # values are hashed with full precision, so that nearby sets of parameters never get the same name.
+    key = ",".join("{}={!r}".format(k, float(v)) for k, v in d.items())
+    name = hashlib.sha1(key.encode()).hexdigest()[:16]
+    if experiment is None:
+        return name
+    else:
+        return "{}_{}".format(experiment, name)
+
+
+def scratch_folder(config):
+    # Folder where the working directories of the simulations are created (see [Scratch] section)
+    if config.has_option('Scratch', 'folder'):
+        return os.path.abspath(os.path.expanduser(os.path.expandvars(config['Scratch']['folder'])))
+    else:
+        return os.path.abspath('.')
+
+
+def copy_back_folder(config):
+    # Folder where the working directories are copied once the simulations are finished, if any
+    if config.has_option('Scratch', 'copy back to'):
+        return os.path.abspath(os.path.expanduser(os.path.expandvars(config['Scratch']['copy back to'])))
+    else:
+        return None
+
+
+def remove_tree(path):
+    # Rename the folder first, so that it disappears at once, even if the deletion of its content is interrupted
+    trash = "{}.{}.deleted".format(path, uuid.uuid4().hex[:8])
+    os.rename(path, trash)
+    shutil.rmtree(trash)
+
+
+def _is_stale(workdir):
+    # Tell whether a working directory has been left by a process which is not running anymore (on this host). If this
+    # cannot be proven (e.g. the lock file is being written, or the process runs on another host), it is kept.
+    try:
+        with open(os.path.join(workdir, LOCK_FILE)) as f:
+            host, pid = f.read().split()
+    except (OSError, ValueError):
+        return False
+    if host != socket.gethostname():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except (OSError, ValueError):
+        pass
+    return False
+
+
+def make_workdir(root, name):
+    """
+    Create the working directory of a simulation, without ever touching a directory used by another process.
+
+    The directory is created exclusively, and a lock file identifies the process which uses it. If a directory with
+    the same name is left by a process which is not running anymore, it is removed. Otherwise (e.g. if the same
+    parameters are evaluated by another process at the same time), a unique suffix is appended to the name.
+
+    Parameters
+    ----------
+    root : str
+        Folder where the working directory is created
+    name : str
+        Name of the simulation
+
+    Returns
+    -------
+    str
+        Path to the working directory
+    """
+    os.makedirs(root, exist_ok=True)
+    workdir = os.path.join(root, name)
+    counter = 0
+    while True:
         try:
-            result = src.substitute(d)
-        except KeyError as e:
-            raise KeyError('Key {} in {} is undefined.'.format(e.args[0], inputfname))
-    text_file = open(outputfname, "w")
-    text_file.write(result)
-    text_file.close()  
+            os.mkdir(workdir)
+            break
+        except FileExistsError:
+            if _is_stale(workdir):
+                # Leftover of an interrupted run
+                try:
+                    remove_tree(workdir)
+                except FileNotFoundError:
+                    # Already removed by another process
+                    pass
+                continue
+            counter += 1
+            workdir = os.path.join(root, '{}.{}-{}'.format(name, os.getpid(), counter))
+    with open(os.path.join(workdir, LOCK_FILE), 'w') as f:
+        f.write('{} {}'.format(socket.gethostname(), os.getpid()))
+    return workdir
+
 
+def CfgGenerator(d, config, restart_folder=None, templates=None):
+    return CfgGeneratorBatch([d], config, restart_folders=[restart_folder], templates=templates)[0]
 
-def CfgGenerator(d, config):
-    fname = "_".join(map(str, d.values()))
-    LH_name = "LHratios_{}.txt".format(fname)
+
+def CfgGeneratorBatch(ds, config, restart_folders=None, templates=None):
+    # Generate the configuration files of many simulations at once. The templates are read from the configuration,
+    # unless they are given (see TemplateSet)
+    if restart_folders is None:
+        restart_folders = [None] * len(ds)
+    if templates is None:
+        templates = TemplateSet.from_config(config)
+    outputs = []
+    jobs = []
+    for d, restart_folder in zip(ds, restart_folders):
+        outputs.append(_prepare(d, config, restart_folder))
+        prm_name, LH_name, _, _ = outputs[-1]
+        jobs.append((d, prm_name, LH_name))
+    templates.render_batch(jobs)
+    return outputs
+
+
+def _prepare(d, config, restart_folder):
+    # Create the working directory of a simulation, and add the reserved variables to the values of the parameters
+    name = simulation_name(d, experiment_name(config))
+
+    # Each simulation runs in its own working directory. The results folder is named after the simulation, even if
+    # the name of the working directory has a suffix
+    workdir = make_workdir(scratch_folder(config), name)
+    fname = os.path.join(workdir, name)
+    LH_name = os.path.join(workdir, "LHratios_{}.txt".format(name))
     prm_name = fname + ".prm"
     d['results'] = fname
     d['LH_name'] = LH_name
-    
-    prisms_templates = config['PRISMS']
-    fileparser(prisms_templates['prm file'], prm_name, d)
-    fileparser(prisms_templates['latent hardening ratio'], LH_name, d)
-    return prm_name, LH_name, fname
+    # Checkpoint to start from (if any), see [Warm Start] section
+    d['restart'] = 'false' if restart_folder is None else 'true'
+    d['restart_folder'] = '' if restart_folder is None else restart_folder
+    d['restart_step'] = config['Warm Start']['restart step'] if config.has_option('Warm Start', 'restart step') else ''
+    return prm_name, LH_name, fname, workdir
     
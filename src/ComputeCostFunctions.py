@@ -1,96 +1,478 @@
 import numpy as np
 import pandas as pd
-import configparser, itertools
-from costFunctions import kinematic_cost_function, static_cost_function, weighted_cost_function
-from triangulate import triangular_projection
+import configparser, hashlib, itertools, multiprocessing, os, tempfile
+from concurrent.futures import ProcessPoolExecutor
+from costFunctions import (TensileCurve, batch_kinematic_cost_function, kinematic_cost_terms, kinematic_normalization,
+                           weighted_cost_function)
+from io_utils import atomic_write, read_stressstrain
+from Profiling import stage
+from triangulate import cached_matrix_projection
 from vtk_utils import read_pvtu
 
+# Pool of processes computing the kinematic cost function on chunks of DIC data, shared by all the datasets
+_executor = None
+
 
 def unpack_str_list(list, dtype=float):
     return [dtype(k) for k in list.split(',')]
     
 
-def compute_kine_cost(result_folder, config):
-    Expe_data = config['Experimental Data']
-    cost_options = config['Cost Function']
-    DIC_data = Expe_data['DIC data']
-    
-    if config.has_option('Experimental Data', 'DIC time steps'):
-        dic_time_steps = unpack_str_list(Expe_data['DIC time steps'], dtype=int)
+def read_time_steps_from_prm(prm_file):
+    """Return the increment numbers corresponding to the tabular time outputs defined in a prm file."""
+    config_template = configparser.ConfigParser(interpolation=None)
+    with open(prm_file) as fp:
+        config_template.read_file(itertools.chain(['[global]'], fp), source=prm_file)
+    dt = float(config_template['global']['set Time increments'])
+    output_table = unpack_str_list(config_template['global']['set Tabular Time Output Table'])
+    dic_time_steps = np.array(output_table)/dt - 1
+    return dic_time_steps.astype('int')
+
+
+def read_number_of_increments(prm_file):
+    """Return the total number of time increments of the simulation defined in a prm file."""
+    config_template = configparser.ConfigParser(interpolation=None)
+    with open(prm_file) as fp:
+        config_template.read_file(itertools.chain(['[global]'], fp), source=prm_file)
+    dt = float(config_template['global']['set Time increments'])
+    total_time = float(config_template['global']['set Total time'])
+    return int(round(total_time / dt))
+
+
+def projection_cache_dir(config):
+    """Return the folder where projection matrices are saved, or None if they are only cached in memory."""
+    if config.has_option('Log File', 'save projections') and config.getboolean('Log File', 'save projections'):
+        logfile = config['Log File']['file path']
+        return os.path.join(os.path.dirname(os.path.abspath(logfile)), 'projection_cache')
     else:
-        # Read time steps from prm file template
-        prm_file = result_folder + ".prm"
-        config_template = configparser.ConfigParser()
-        with open(prm_file) as fp:
-            config_template.read_file(itertools.chain(['[global]'], fp), source=prm_file)
-        dt = float(config_template['global']['set Time increments'])
-        output_table = unpack_str_list(config_template['global']['set Tabular Time Output Table'])
-        dic_time_steps = np.array(output_table)/dt - 1
-        dic_time_steps = dic_time_steps.astype('int')
-
-    chi_u = 0
-    n_steps = len(dic_time_steps)
-    for step, step_simu in enumerate(dic_time_steps):
-        pvtu_fname = "{}/solution-{:04}.pvtu".format(result_folder, step_simu)
-        nodes, u_SIM = read_pvtu(pvtu_fname)
-        if nodes is None:
-            # It seems that the simulation has failed, raise penalty value
-            chi_u = float(cost_options['penalty'])
-            n_steps = 1
-            break
+        return None
+
+
+def convert_dic_file(csv_file, npy_file, chunk_size):
+    """
+    Convert a DIC CSV file into a .npy file, reading chunk_size lines at a time, so that the whole file is never loaded
+    into memory.
+
+    Parameters
+    ----------
+    csv_file : str
+        Path to CSV file
+    npy_file : str
+        Path to .npy file
+    chunk_size : int
+        Number of lines read at once
+    """
+    def read_chunks():
+        return pd.read_csv(csv_file, sep=r'\s+', header=None, comment='#', chunksize=chunk_size, dtype=float,
+                           float_precision='round_trip')
+
+    # First pass to get the size of the array
+    n_rows, n_cols = 0, 0
+    for chunk in read_chunks():
+        n_rows += len(chunk)
+        n_cols = chunk.shape[1]
+    array = np.lib.format.open_memmap(npy_file, mode='w+', dtype=float, shape=(n_rows, n_cols))
+    start = 0
+    for chunk in read_chunks():
+        array[start:start + len(chunk)] = chunk.to_numpy()
+        start += len(chunk)
+    array.flush()
+    del array
+
+
+def load_dic_file(csv_file, binary_cache=False, chunk_size=None):
+    """
+    Read DIC data from CSV file.
+
+    Parameters
+    ----------
+    csv_file : str
+        Path to CSV file
+    binary_cache : bool, optional
+        If True, the data is converted into a .npy file (next to the CSV file) at first use, then memory-mapped from
+        it. The default is False.
+    chunk_size : int, optional
+        If given, the conversion into a .npy file (which is then enabled) reads the CSV file chunk_size lines at a
+        time. The default is None.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of DIC data
+    """
+    if not binary_cache and chunk_size is None:
+        return np.ascontiguousarray(np.loadtxt(csv_file), dtype=float)
+    npy_file = os.path.splitext(csv_file)[0] + '.npy'
+    if not os.path.isfile(npy_file) or os.path.getmtime(npy_file) < os.path.getmtime(csv_file):
+        with atomic_write(npy_file) as tmp_file:
+            if chunk_size is None:
+                np.save(tmp_file, np.ascontiguousarray(np.loadtxt(csv_file), dtype=float))
+            else:
+                convert_dic_file(csv_file, tmp_file, chunk_size)
+    return np.load(npy_file, mmap_mode='r')
+
+
+class ExperimentalDataset:
+    """
+    Experimental data and cost function options, loaded once per optimization run.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+    """
+
+    def __init__(self, config):
+        Expe_data = config['Experimental Data']
+        cost_options = config['Cost Function']
+        self.penalty = float(cost_options['penalty'])
+        self.w_sigma = float(cost_options['weight on tensile curve'])
+        wgt_str = 'weight by correlation coefficients'
+        self.weight_by_correlation = config.has_option('Cost Function', wgt_str) and \
+            config.getboolean('Cost Function', wgt_str)
+        self.projection_cache_dir = projection_cache_dir(config)
+        if config.has_option('Cost Function', 'number of processes'):
+            self.n_processes = config.getint('Cost Function', 'number of processes')
+        else:
+            self.n_processes = 1
+
+        # Read data from experimental tensile curve
+        Exper_curve = np.loadtxt(Expe_data['tensile curve'])
+        self.elon_expe = np.ascontiguousarray(Exper_curve[:, 0])
+        self.stress_expe = np.ascontiguousarray(Exper_curve[:, 1])
+        if config.has_option('Cost Function', 'tensile curve resampling'):
+            resampling = config.getint('Cost Function', 'tensile curve resampling')
+        else:
+            resampling = None
+        metric = cost_options.get('tensile curve metric', 'pointwise').lower()
+        self.tensile_curve = TensileCurve(self.elon_expe, self.stress_expe, resampling=resampling, metric=metric)
+        if config.has_option('Experimental Data', 'tensile direction'):
+            self.tensile_dir = Expe_data['tensile direction'].lower()
+        else:
+            self.tensile_dir = 'x'
+
+        # Time steps related to DIC measurements
+        if config.has_option('Experimental Data', 'DIC time steps'):
+            self.dic_time_steps = unpack_str_list(Expe_data['DIC time steps'], dtype=int)
+        else:
+            try:
+                # Read time steps from prm file template
+                self.dic_time_steps = read_time_steps_from_prm(config['PRISMS']['prm file'])
+            except (KeyError, ValueError, configparser.Error):
+                # The time steps are parametrized: they will be read from the generated prm files
+                self.dic_time_steps = None
+
+        # Read DIC data
+        binary_cache = config.has_option('Experimental Data', 'binary DIC cache') and \
+            config.getboolean('Experimental Data', 'binary DIC cache')
+        if config.has_option('Experimental Data', 'DIC chunk size'):
+            # Streaming mode: the DIC data are memory-mapped, and processed by chunks of points
+            self.dic_chunk_size = int(config.getfloat('Experimental Data', 'DIC chunk size'))
         else:
-            # Read DIC data
-            DIC_step = '{}{}.csv'.format(DIC_data, str(step+1))
-            DIC_vals = np.loadtxt(DIC_step)
-            pts_DIC = DIC_vals[:, :2]
-            u_DIC = DIC_vals[:, 2:4]
-
-            # Associate each DIC measurement to a unique node
-            u_SIM_tri, inside_mesh = triangular_projection(nodes, u_SIM, pts_DIC)
-            
+            self.dic_chunk_size = None
+        DIC_data = Expe_data['DIC data']
+        self.dic_data = DIC_data
+        self.dic_steps = []
+        self.dic_files = []
+        step = 1
+        while os.path.isfile('{}{}.csv'.format(DIC_data, step)):
+            csv_file = '{}{}.csv'.format(DIC_data, step)
+            self.dic_steps.append(load_dic_file(csv_file, binary_cache=binary_cache, chunk_size=self.dic_chunk_size))
+            self.dic_files.append(os.path.splitext(csv_file)[0] + '.npy' if isinstance(self.dic_steps[-1], np.memmap)
+                                  else None)
+            step += 1
+        if not self.dic_steps:
+            raise ValueError('No DIC file found: {}1.csv does not exist.'.format(DIC_data))
+        if self.dic_time_steps is not None:
+            self._check_dic_steps(self.dic_time_steps)
+        self._normalizations = {}
+
+    def _check_dic_steps(self, time_steps):
+        # Each simulated step must be compared with a DIC file
+        if len(time_steps) > len(self.dic_steps):
+            raise ValueError('{} DIC time steps are requested, but only {} DIC file(s) have been found ({}1.csv to '
+                             '{}{}.csv).'.format(len(time_steps), len(self.dic_steps), self.dic_data,
+                                                 self.dic_data, len(self.dic_steps)))
+
+    def kinematic_normalization(self, step, inside_mesh):
+        """
+        Return the normalization factor of the kinematic cost function related to a step of DIC measurements (see
+        costFunctions.kinematic_normalization). It only depends on the DIC data and on the DIC points inside the mesh,
+        so it is computed once per mesh.
+
+        Parameters
+        ----------
+        step : int
+            Index of the DIC step
+        inside_mesh : numpy.ndarray
+            Array of bools indicating which DIC points are inside the mesh
+
+        Returns
+        -------
+        float
+            Normalization factor
+        """
+        key = (step, hashlib.sha1(np.packbits(inside_mesh)).hexdigest())
+        if key not in self._normalizations:
+            DIC_vals = self.dic_steps[step]
+            weights = DIC_vals[inside_mesh, 4] if self.weight_by_correlation else None
+            self._normalizations[key] = kinematic_normalization(DIC_vals[inside_mesh, 2:4], weights=weights)
+        return self._normalizations[key]
+
+    def time_steps(self, result_folder):
+        """Return the increment numbers corresponding to each step of DIC measurements."""
+        if self.dic_time_steps is None:
+            time_steps = read_time_steps_from_prm(result_folder + ".prm")
+            self._check_dic_steps(time_steps)
+            return time_steps
+        else:
+            return self.dic_time_steps
+
+
+def kine_cost_terms(nodes, u_SIM, DIC_vals, weight_by_correlation, cache_dir=None, keep_in_memory=True):
+    """
+    Compute the numerator and the denominator of the kinematic cost function related to (a chunk of) a step of DIC
+    measurements (see costFunctions.kinematic_cost_terms).
+
+    Parameters
+    ----------
+    nodes : numpy.ndarray
+        m x 2 array of surface nodes
+    u_SIM : numpy.ndarray
+        m x 3 array of displacements of the surface nodes
+    DIC_vals : numpy.ndarray
+        DIC data (x, y, ux, uy and correlation coefficient of each point)
+    weight_by_correlation : bool
+        Whether the displacement errors are weighted by the inverse of the correlation coefficients
+    cache_dir : str, optional
+        Folder where the projection matrices are cached on disk. The default is None.
+    keep_in_memory : bool, optional
+        Whether the projection matrix is kept in memory (see triangulate.cached_matrix_projection). The default is True.
+
+    Returns
+    -------
+    float
+        Numerator of the kinematic cost function
+    float
+        Denominator of the kinematic cost function
+    """
+    DIC_vals = np.asarray(DIC_vals, dtype=float)
+
+    # Associate each DIC measurement to a unique node
+    # The mesh does not change during optimization, so the projection matrix is computed only once
+    with stage('projection'):
+        mat, inside_mesh = cached_matrix_projection(nodes, DIC_vals[:, :2], cache_dir=cache_dir,
+                                                    keep_in_memory=keep_in_memory)
+        u_SIM_tri = np.asarray(mat.dot(u_SIM), dtype=float)
+
+    # Remove DIC locations outside the RoI
+    u_SIM_tri = u_SIM_tri[inside_mesh]
+
+    if weight_by_correlation:
+        C = DIC_vals[inside_mesh, 4]
+    else:
+        C = None
+    return kinematic_cost_terms(u_SIM_tri, DIC_vals[inside_mesh, 2:4], weights=C)
+
+
+def _kine_cost_chunk(nodes_file, u_file, dic_file, start, stop, weight_by_correlation, cache_dir):
+    # Run by the worker processes: the simulated fields are memory-mapped from the files written once per step, and
+    # only the requested chunk of the DIC file is read
+    nodes = np.load(nodes_file, mmap_mode='r')
+    u_SIM = np.load(u_file, mmap_mode='r')
+    DIC_vals = np.load(dic_file, mmap_mode='r')[start:stop]
+    return kine_cost_terms(nodes, u_SIM, DIC_vals, weight_by_correlation, cache_dir=cache_dir, keep_in_memory=False)
+
+
+def chunk_executor(max_workers):
+    """
+    Return the pool of processes used for computing the kinematic cost function on chunks of DIC data. The workers are
+    spawned (not forked), since the pool may be created by a process already running threads (e.g. those monitoring
+    the simulations).
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def chunked_kine_costs(nodes_steps, u_steps, data):
+    """
+    Compute the kinematic cost functions related to each step of DIC measurements, by chunks of DIC points, so that
+    the memory usage is bounded by the chunk size rather than by the size of the DIC data. If several processes are
+    allowed, the chunks of all the steps are spread across a pool of processes.
+
+    Parameters
+    ----------
+    nodes_steps : list of numpy.ndarray
+        m x 2 array of surface nodes at each step of DIC measurements
+    u_steps : list of numpy.ndarray
+        m x 3 array of displacements of the surface nodes at each step of DIC measurements
+    data : ExperimentalDataset
+        Experimental data and cost function options, with data.dic_chunk_size set
+
+    Returns
+    -------
+    list of float
+        Kinematic cost function related to each step
+    """
+    chunk_size = data.dic_chunk_size
+    terms = []
+    if data.n_processes > 1:
+        executor = chunk_executor(data.n_processes)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for step, (nodes, u_SIM, dic_file, DIC_vals) in enumerate(zip(nodes_steps, u_steps, data.dic_files,
+                                                                          data.dic_steps)):
+                # The simulated fields are written once per step, instead of being sent along with every chunk
+                nodes_file = os.path.join(tmp_dir, 'nodes_{}.npy'.format(step))
+                u_file = os.path.join(tmp_dir, 'u_{}.npy'.format(step))
+                np.save(nodes_file, nodes)
+                np.save(u_file, u_SIM)
+                terms.append([executor.submit(_kine_cost_chunk, nodes_file, u_file, dic_file, start,
+                                              start + chunk_size, data.weight_by_correlation,
+                                              data.projection_cache_dir)
+                              for start in range(0, len(DIC_vals), chunk_size)])
+            terms = [[future.result() for future in futures] for futures in terms]
+    else:
+        for nodes, u_SIM, DIC_vals in zip(nodes_steps, u_steps, data.dic_steps):
+            terms.append([kine_cost_terms(nodes, u_SIM, DIC_vals[start:start + chunk_size], data.weight_by_correlation,
+                                          cache_dir=data.projection_cache_dir, keep_in_memory=False)
+                          for start in range(0, len(DIC_vals), chunk_size)])
+    return [sum(numerator for numerator, _ in step_terms) / sum(K for _, K in step_terms) for step_terms in terms]
+
+
+def compute_kine_cost_step(nodes, u_SIM, DIC_vals, data):
+    """Compute the kinematic cost function related to a single step of DIC measurements."""
+    if data.dic_chunk_size is None:
+        numerator, K = kine_cost_terms(nodes, u_SIM, DIC_vals, data.weight_by_correlation,
+                                       cache_dir=data.projection_cache_dir)
+        return numerator / K
+
+    # Accumulate the terms of the cost function chunk by chunk
+    numerator, K = 0., 0.
+    for start in range(0, len(DIC_vals), data.dic_chunk_size):
+        terms = kine_cost_terms(nodes, u_SIM, DIC_vals[start:start + data.dic_chunk_size], data.weight_by_correlation,
+                                cache_dir=data.projection_cache_dir, keep_in_memory=False)
+        numerator += terms[0]
+        K += terms[1]
+    return numerator / K
+
+
+def batch_kine_cost(nodes_steps, u_steps, data):
+    """
+    Compute the kinematic cost functions of many simulations sharing the same mesh at once.
+
+    Parameters
+    ----------
+    nodes_steps : list of numpy.ndarray
+        m x 2 array of surface nodes at each step of DIC measurements
+    u_steps : list of numpy.ndarray
+        Array of shape (n_sims, m, 3) of displacements of the surface nodes at each step of DIC measurements
+    data : ExperimentalDataset
+        Experimental data and cost function options
+
+    Returns
+    -------
+    numpy.ndarray
+        Kinematic cost function of each simulation (mean over the steps)
+    """
+    n_sims = len(u_steps[0])
+    if data.dic_chunk_size is not None:
+        # The DIC data are too large to be stacked: process the simulations one by one, by chunks
+        return np.array([np.mean(chunked_kine_costs(nodes_steps, [u_SIM[i] for u_SIM in u_steps], data))
+                         for i in range(n_sims)])
+
+    # Only the DIC steps which have been simulated are accounted for
+    chi_u = np.zeros((n_sims, len(u_steps)))
+    for step, (nodes, u_SIM) in enumerate(zip(nodes_steps, u_steps)):
+        DIC_vals = data.dic_steps[step]
+        # The projection matrix only depends on the mesh, so it is shared by all the simulations
+        with stage('projection'):
+            mat, inside_mesh = cached_matrix_projection(nodes, DIC_vals[:, :2], cache_dir=data.projection_cache_dir)
+            u_SIM = np.moveaxis(np.asarray(u_SIM)[..., :2], 0, 1).reshape(len(nodes), -1)
             # Remove DIC locations outside the RoI
-            u_SIM_tri = u_SIM_tri[inside_mesh]
+            u_SIM_tri = np.moveaxis(mat.dot(u_SIM)[inside_mesh].reshape(-1, n_sims, 2), 1, 0)
+
+        weights = DIC_vals[inside_mesh, 4] if data.weight_by_correlation else None
+        chi_u[:, step] = batch_kinematic_cost_function(u_SIM_tri[:, np.newaxis], DIC_vals[np.newaxis, inside_mesh, 2:4],
+                                                       weights=None if weights is None else weights[np.newaxis],
+                                                       K=data.kinematic_normalization(step, inside_mesh))[:, 0]
+    return np.mean(chi_u, axis=1)
 
-            wgt_str = 'weight by correlation coefficients'
-            if config.has_option('Cost Function', wgt_str) and config.getboolean('Cost Function', wgt_str):
-                C = DIC_vals[inside_mesh, 4]
-            else:
-                C = None
-            chi_u += kinematic_cost_function(u_SIM_tri, u_DIC[inside_mesh], weights=C)
 
-    return chi_u/n_steps
+def read_displacements(result_folder, data):
+    """
+    Read the surface nodes and the displacements at each DIC step from the pvtu files of a simulation.
 
+    Returns
+    -------
+    list of numpy.ndarray
+        Nodes at each DIC step
+    list of numpy.ndarray
+        Displacements at each DIC step. Both lists stop at the first missing step, if the simulation has failed.
+    bool
+        False if the simulation has failed before the last DIC step
+    """
+    nodes_steps, u_steps = [], []
+    for step_simu in data.time_steps(result_folder):
+        pvtu_fname = "{}/solution-{:04}.pvtu".format(result_folder, step_simu)
+        with stage('reading pvtu'):
+            nodes, u_SIM = read_pvtu(pvtu_fname)
+        if nodes is None:
+            return nodes_steps, u_steps, False
+        nodes_steps.append(nodes)
+        u_steps.append(u_SIM)
+    return nodes_steps, u_steps, True
 
-def compute_stat_cost(result_folder, config):
-    # Read data from experimental tensile curve
-    tensileCurve = config['Experimental Data']['tensile curve']
-    Exper_curve = np.loadtxt(tensileCurve)
-    elon_expe = Exper_curve[:, 0]
-    stress_expe = Exper_curve[:, 1]
 
+def compute_kine_cost(result_folder, data, displacements=None):
+    if displacements is None:
+        displacements = read_displacements(result_folder, data)
+    nodes_steps, u_steps, complete = displacements
+    if not complete:
+        # It seems that the simulation has failed, raise penalty value
+        return data.penalty
+
+    if data.dic_chunk_size is not None:
+        return np.mean(chunked_kine_costs(nodes_steps, u_steps, data))
+    return batch_kine_cost(nodes_steps, [u_SIM[np.newaxis] for u_SIM in u_steps], data)[0]
+
+
+def read_simulated_curve(result_folder, data, complete_lines_only=False):
+    """
+    Return the simulated elongation and tensile stress. Raise FileNotFoundError if the simulation has failed. If the
+    simulation is running, use complete_lines_only (see io_utils.read_stressstrain).
+    """
+    columns = ['E' + 2 * data.tensile_dir, 'T' + 2 * data.tensile_dir]
+    stressstrain = read_stressstrain(result_folder + '/stressstrain.txt', columns=columns,
+                                     complete_lines_only=complete_lines_only)
+    return simulated_curve(stressstrain, data)
+
+
+def simulated_curve(stressstrain, data):
+    """Return the simulated elongation and tensile stress from the table of a stressstrain.txt file."""
+    col_E = 'E' + 2 * data.tensile_dir
+    col_sigma = 'T' + 2 * data.tensile_dir
+    gl_eps = stressstrain[col_E]
+    elon_simu = -1 + np.sqrt(1 + 2 * gl_eps)  # Compute elongation from Green-Lagrangian strain
+    stress_simu = stressstrain[col_sigma]
+    return elon_simu, stress_simu
+
+
+def compute_stat_cost(result_folder, data):
     # Fetch simulated tensile curve
-    if config.has_option('Experimental Data', 'tensile direction'):
-        tensile_dir = config['Experimental Data']['tensile direction'].lower()
-    else:
-        tensile_dir = 'x'
-    col_E = 'E' + 2 * tensile_dir
-    col_sigma = 'T' + 2 * tensile_dir
     try:
-        stressstrain = pd.read_csv(result_folder + '/stressstrain.txt', sep='\t')
-        gl_eps = stressstrain[col_E]
-        elon_simu = -1 + np.sqrt(1 + 2 * gl_eps)  # Compute elongation from Green-Lagrangian strain
-        stress_simu = stressstrain[col_sigma]
-        return static_cost_function(elon_expe, stress_expe, elon_simu, stress_simu)
+        with stage('reading tensile curve'):
+            elon_simu, stress_simu = read_simulated_curve(result_folder, data)
+        return data.tensile_curve.cost(elon_simu, stress_simu)
     except FileNotFoundError:
-        return float(config['Cost Function']['penalty'])
+        return data.penalty
 
 
-def compute_weighted_cost(result_folder, config):
-    # Compute cost functions
-    chi_u = compute_kine_cost(result_folder, config)
-    chi_F = compute_stat_cost(result_folder, config)
+def compute_weighted_cost(result_folder, data, displacements=None):
+    # Compute cost functions. The displacements can be given if they have already been read (see read_displacements).
+    chi_u = compute_kine_cost(result_folder, data, displacements=displacements)
+    chi_F = compute_stat_cost(result_folder, data)
    
     # Return both cost functions, plus the weighted mean
-    w_sigma = float(config['Cost Function']['weight on tensile curve'])
-    chi = weighted_cost_function(chi_F, chi_u, w1=w_sigma)
+    chi = weighted_cost_function(chi_F, chi_u, w1=data.w_sigma)
     return {'chi_u': chi_u, 'chi_f': chi_F, 'chi': chi}
@@ -0,0 +1,175 @@
+import configparser
+import os
+
+import numpy as np
+import pandas as pd
+
+from ComputeCostFunctions import compute_kine_cost_step, read_number_of_increments, read_simulated_curve
+from costFunctions import weighted_cost_function
+from vtk_utils import read_pvtu
+
+
+class CostMonitor:
+    """
+    Watch the results of a running simulation, and compute a lower bound of its cost function from the data
+    available so far. Calling the monitor returns True if this lower bound already exceeds a given threshold, meaning
+    that the simulation can be stopped.
+
+    The lower bound of the static cost function assumes that the remaining increments give no error, and the largest
+    possible normalization factor. The lower bound of the kinematic cost function only accounts for the DIC steps
+    already simulated.
+
+    Parameters
+    ----------
+    result_folder : str
+        Folder where the simulation writes its results
+    data : ComputeCostFunctions.ExperimentalDataset
+        Experimental data
+    threshold : float
+        Threshold above which the simulation should be stopped
+    """
+
+    def __init__(self, result_folder, data, threshold):
+        self.result_folder = result_folder
+        self.data = data
+        self.threshold = threshold
+        self.lower_bound = 0.
+        self.stopped = False
+        self.step_costs = {}
+        try:
+            self.n_increments = read_number_of_increments(result_folder + '.prm')
+        except (OSError, KeyError, ValueError, configparser.Error):
+            self.n_increments = None
+        try:
+            self.time_steps = data.time_steps(result_folder)
+        except (OSError, KeyError, ValueError, configparser.Error):
+            self.time_steps = []
+
+    def static_lower_bound(self):
+        """
+        Compute a lower bound of the static cost function from the simulated tensile curve written so far.
+
+        Returns
+        -------
+        float
+            Lower bound of the static cost function
+        int
+            Number of increments written so far
+        """
+        try:
+            # The file is being written: its last line may be incomplete
+            elon_simu, stress_simu = read_simulated_curve(self.result_folder, self.data, complete_lines_only=True)
+        except (FileNotFoundError, pd.errors.EmptyDataError, KeyError, ValueError):
+            return 0., 0
+        elon_simu = np.asarray(elon_simu, dtype=float)
+        stress_simu = np.asarray(stress_simu, dtype=float)
+        complete = np.isfinite(elon_simu) & np.isfinite(stress_simu)  # Lines with missing columns
+        elon_simu, stress_simu = elon_simu[complete], stress_simu[complete]
+        n_seen = len(elon_simu)
+        curve = self.data.tensile_curve
+        if self.n_increments is None or n_seen == 0 or curve.metric != 'pointwise':
+            # The final elongation is unknown, so no bound can be given for the integral metric
+            return 0., n_seen
+        sigma_exp_interp = curve(elon_simu)
+        num = np.sum((stress_simu - sigma_exp_interp) ** 2)
+        # At most one line per increment (plus the initial state) remains to be written
+        n_remaining = max(self.n_increments + 1 - n_seen, 0)
+        K_max = np.sum(sigma_exp_interp ** 2) + n_remaining * np.max(curve.sigma ** 2)
+        return num / K_max, n_seen
+
+    def kinematic_lower_bound(self, n_seen):
+        """
+        Compute a lower bound of the kinematic cost function from the DIC steps simulated so far.
+
+        Parameters
+        ----------
+        n_seen : int
+            Number of increments written so far
+
+        Returns
+        -------
+        float
+            Lower bound of the kinematic cost function
+        """
+        n_steps = len(self.time_steps)
+        for step, step_simu in enumerate(self.time_steps):
+            if step in self.step_costs:
+                continue
+            # The results of a step are complete once the simulation has gone further
+            if step + 1 < n_steps:
+                next_pvtu = "{}/solution-{:04}.pvtu".format(self.result_folder, self.time_steps[step + 1])
+                done = os.path.exists(next_pvtu) or n_seen > step_simu + 1
+            else:
+                done = n_seen > step_simu + 1
+            if not done:
+                break
+            try:
+                nodes, u_SIM = read_pvtu("{}/solution-{:04}.pvtu".format(self.result_folder, step_simu))
+                if nodes is None:
+                    break
+                self.step_costs[step] = compute_kine_cost_step(nodes, u_SIM, self.data.dic_steps[step], self.data)
+            except Exception:
+                # The files may be still being written
+                break
+        if n_steps == 0:
+            return 0.
+        return sum(self.step_costs.values()) / n_steps
+
+    def __call__(self):
+        chi_f, n_seen = self.static_lower_bound()
+        chi_u = self.kinematic_lower_bound(n_seen)
+        self.lower_bound = weighted_cost_function(chi_f, chi_u, w1=self.data.w_sigma)
+        self.stopped = self.lower_bound > self.threshold
+        return self.stopped
+
+
+class StencilMonitor:
+    """
+    Monitor of a simulation run for estimating the gradient by finite differences. Such a simulation is not stopped
+    because of its own cost function (a penalty would produce a spurious gradient); instead, it is stopped as soon as
+    the simulation of the base point has been stopped, since its cost function is not needed anymore.
+
+    Parameters
+    ----------
+    base_monitors : list of CostMonitor
+        Monitors of the simulations of the base point (one per experiment)
+    """
+
+    def __init__(self, base_monitors):
+        self.base_monitors = base_monitors
+
+    def __call__(self):
+        return any(monitor.stopped for monitor in self.base_monitors)
+
+
+def termination_threshold(config, log):
+    """
+    Compute the threshold above which running simulations are stopped, from the [Early Termination] section.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+    log : EvaluationLog.EvaluationLog
+        Log of evaluations, used for finding the best cost function so far
+
+    Returns
+    -------
+    float or None
+        Threshold, or None if early termination is disabled
+    """
+    section = 'Early Termination'
+    if not (config.has_option(section, 'use early termination') and config.getboolean(section,
+                                                                                      'use early termination')):
+        return None
+    thresholds = []
+    if config.has_option(section, 'threshold'):
+        thresholds.append(config.getfloat(section, 'threshold'))
+    if config.has_option(section, 'relative threshold'):
+        best = log.min_value('chi')
+        if best is not None:
+            thresholds.append(config.getfloat(section, 'relative threshold') * best)
+    if thresholds:
+        return min(thresholds)
+    else:
+        return None
@@ -0,0 +1,224 @@
+import csv
+import io
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+try:
+    import fcntl
+except ImportError:
+    # File locking is not available (e.g. on Windows)
+    fcntl = None
+
+
+# Number of rows that can be appended to the log before the k-d tree is built again (at least)
+max_untracked_rows = 64
+
+
+def is_penalized(values, penalty):
+    """Tell whether one of the cost functions is the penalty value (i.e. a simulation has failed or been stopped)."""
+    return any(value == penalty for value in values)
+
+
+class EvaluationLog:
+    """
+    Log file of the evaluated parameters and the related cost functions.
+
+    The log file is read only once; afterwards, only the rows appended since the last read (possibly by other
+    processes) are parsed. The evaluated (normalized) parameters are indexed by a k-d tree, so that looking for a
+    previous evaluation only takes logarithmic time with respect to the number of rows in the log, whatever the number
+    of parameters. The rows appended since the tree was built are scanned directly, until there are enough of them to
+    build the tree again.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to log file (CSV format)
+    col_names : list of str
+        Names of the columns. The first columns must be the parameters.
+    lb : numpy.ndarray
+        Lower bounds of the parameters
+    ub : numpy.ndarray
+        Upper bounds of the parameters
+    atol : float
+        Absolute tolerance on normalized parameters, used to tell whether two sets of parameters are the same
+    """
+
+    def __init__(self, file_path, col_names, lb, ub, atol):
+        self.file_path = file_path
+        self.col_names = list(col_names)
+        self.lb = np.asarray(lb, dtype=float)
+        self.dom_size = np.asarray(ub, dtype=float) - self.lb
+        self.atol = atol
+        self.header = None
+        self.rows = []
+        self._normalized = []  # Normalized parameters of each row
+        self._tree = None  # k-d tree of the first rows
+        self._n_tree = 0  # Number of rows in the tree
+        self._offset = 0
+        self.refresh()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _lock(self, f, exclusive=False):
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def _unlock(self, f):
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    def normalize(self, p):
+        """Normalize parameters with respect to the bounds."""
+        return (np.asarray(p, dtype=float) - self.lb) / self.dom_size
+
+    def _read_tail(self, f):
+        # Parse the rows appended since the last read. The file must be opened in binary mode, and locked.
+        f.seek(self._offset)
+        data = f.read()
+        end = data.rfind(b'\n') + 1  # Never parse an incomplete line
+        if end == 0:
+            return
+        self._offset += end
+        lines = list(csv.reader(io.StringIO(data[:end].decode())))
+        if self.header is None:
+            self.header = lines.pop(0)
+        for line in lines:
+            if line:
+                self._add_row(np.array([float(v) for v in line]))
+
+    def _add_row(self, row):
+        self._normalized.append(self.normalize(row[:len(self.lb)]))
+        self.rows.append(row)
+        if len(self.rows) - self._n_tree > max(max_untracked_rows, self._n_tree // 4):
+            self._tree = cKDTree(np.array(self._normalized))
+            self._n_tree = len(self.rows)
+
+    def refresh(self):
+        """
+        Read the rows appended to the log file since the last read.
+        """
+        if not os.path.isfile(self.file_path):
+            return
+        with open(self.file_path, 'rb') as f:
+            self._lock(f)
+            try:
+                self._read_tail(f)
+            finally:
+                self._unlock(f)
+
+    def lookup(self, p):
+        """
+        Look for a previous evaluation of a given set of parameters.
+
+        Parameters
+        ----------
+        p : numpy.ndarray
+            Array of (un-normalized) parameters
+
+        Returns
+        -------
+        dict or None
+            Values of the first matching row in the log file, sorted by column names. None if these parameters have
+            not been evaluated yet.
+        """
+        self.refresh()
+        return self._find(p)
+
+    def _find(self, p):
+        # Same as lookup, without reading the new rows of the log file
+        pn = self.normalize(p)
+        matches = []
+        if self._tree is not None:
+            # Same tolerance along each parameter: use the Chebyshev distance
+            matches += self._tree.query_ball_point(pn, r=self.atol, p=np.inf)
+        if len(self.rows) > self._n_tree:
+            untracked = np.abs(np.array(self._normalized[self._n_tree:]) - pn) <= self.atol
+            matches += list(self._n_tree + np.flatnonzero(np.all(untracked, axis=1)))
+        if matches:
+            return dict(zip(self.header, self.rows[min(matches)]))
+        else:
+            return None
+
+    def lookup_neighbour(self, p, step):
+        """
+        Look for a previous evaluation of parameters which differ from given ones by a single step along one of the
+        parameters (e.g. the base point of a finite-difference estimation of the gradient).
+
+        Parameters
+        ----------
+        p : numpy.ndarray
+            Array of (un-normalized) parameters
+        step : float
+            Step, with respect to normalized parameters
+
+        Returns
+        -------
+        dict or None
+            Values of the matching row in the log file, sorted by column names. None if no such evaluation exists.
+        """
+        self.refresh()
+        for j in range(len(p)):
+            for sign in (-1, 1):
+                q = np.array(p, dtype=float)
+                q[j] += sign * step * self.dom_size[j]
+                row = self._find(q)
+                if row is not None:
+                    return row
+        return None
+
+    def min_value(self, col_name='chi'):
+        """
+        Return the lowest value of a given column in the log file.
+
+        Parameters
+        ----------
+        col_name : str, optional
+            Name of the column. The default is 'chi'.
+
+        Returns
+        -------
+        float or None
+            Lowest value, or None if the log is empty
+        """
+        self.refresh()
+        if not self.rows:
+            return None
+        j = self.header.index(col_name)
+        return min(row[j] for row in self.rows)
+
+    def append(self, values):
+        """
+        Append a row to the log file. The header is written if the file is empty.
+
+        Parameters
+        ----------
+        values : list or numpy.ndarray
+            Values to write, in the same order as the column names
+
+        Returns
+        -------
+        int
+            Index of the new row in the log file
+        """
+        row = np.asarray(values, dtype=float)
+        with open(self.file_path, 'a+b') as f:
+            self._lock(f, exclusive=True)
+            try:
+                self._read_tail(f)
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, lineterminator='\n')
+                if self.header is None:
+                    self.header = self.col_names
+                    writer.writerow(self.header)
+                writer.writerow([repr(float(v)) for v in row])
+                f.seek(0, os.SEEK_END)
+                f.write(buffer.getvalue().encode())
+                f.flush()
+                self._offset = f.tell()
+                self._add_row(row)
+            finally:
+                self._unlock(f)
+        return len(self.rows) - 1
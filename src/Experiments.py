@@ -0,0 +1,126 @@
+import configparser
+
+# Options of an [Experiment <name>] section, and the sections of the main configuration they override
+EXPERIMENT_OPTIONS = {'prm file': 'PRISMS',
+                      'latent hardening ratio': 'PRISMS',
+                      'dic data': 'Experimental Data',
+                      'dic time steps': 'Experimental Data',
+                      'tensile curve': 'Experimental Data',
+                      'tensile direction': 'Experimental Data',
+                      'binary dic cache': 'Experimental Data',
+                      'dic chunk size': 'Experimental Data',
+                      'weight on tensile curve': 'Cost Function',
+                      'weight by correlation coefficients': 'Cost Function',
+                      'tensile curve resampling': 'Cost Function',
+                      'tensile curve metric': 'Cost Function',
+                      'mesh': 'Experiment'}
+
+
+class Experiment:
+    """
+    Mechanical test used for calibration (specimen and loading direction), with its own templates and experimental
+    data.
+
+    Parameters
+    ----------
+    name : str or None
+        Name of the experiment, or None if the configuration defines a single experiment
+    config : configparser.ConfigParser
+        Configuration data of this experiment, with the same sections as the main configuration
+    weight : float, optional
+        Weight of the experiment in the overall cost function. The default is 1.
+    """
+
+    def __init__(self, name, config, weight=1.):
+        self.name = name
+        self.config = config
+        self.weight = weight
+
+    @property
+    def chi_names(self):
+        """Names of the columns of the log file related to this experiment."""
+        if self.name is None:
+            return ['chi_u', 'chi_f']
+        else:
+            return ['chi_u_' + self.name, 'chi_f_' + self.name, 'chi_' + self.name]
+
+    def log_values(self, chis):
+        """Return the values to write in the log file, from the cost functions of this experiment."""
+        if self.name is None:
+            return [chis['chi_u'], chis['chi_f']]
+        else:
+            return [chis['chi_u'], chis['chi_f'], chis['chi']]
+
+
+def read_experiments(config):
+    """
+    Read the list of experiments from the [Experiments] section. Each experiment is defined in a section named
+    [Experiment <name>], whose options override those of [PRISMS], [Experimental Data] and [Cost Function].
+
+    If the [Experiments] section is missing, the main configuration defines a single experiment.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+
+    Returns
+    -------
+    list of Experiment
+        Experiments used for calibration
+    """
+    if not config.has_option('Experiments', 'names'):
+        return [Experiment(None, config)]
+
+    names = [name.strip() for name in config['Experiments']['names'].split(',') if name.strip()]
+    experiments = []
+    for name in names:
+        section = 'Experiment {}'.format(name)
+        if not config.has_section(section):
+            raise ValueError('Section [{}] is missing.'.format(section))
+
+        # Copy the raw values, so that they are not interpolated twice
+        sub_config = configparser.ConfigParser()
+        sub_config.read_dict({s: dict(config.items(s, raw=True)) for s in config.sections()})
+        for s in set(EXPERIMENT_OPTIONS.values()):
+            if not sub_config.has_section(s):
+                sub_config.add_section(s)
+        sub_config['Experiment']['name'] = name
+        weight = 1.
+        for option, value in config.items(section, raw=True):
+            if option == 'weight':
+                weight = config.getfloat(section, option)
+            elif option in EXPERIMENT_OPTIONS:
+                sub_config[EXPERIMENT_OPTIONS[option]][option] = value
+            else:
+                raise ValueError('Unknown option "{}" in section [{}].'.format(option, section))
+        experiments.append(Experiment(name, sub_config, weight=weight))
+    return experiments
+
+
+def experiment_name(config):
+    """Return the name of the experiment described by a configuration, or None if there is only one experiment."""
+    if config.has_option('Experiment', 'name'):
+        return config['Experiment']['name']
+    else:
+        return None
+
+
+def combine_costs(experiments, chis):
+    """
+    Compute the overall cost function, as the weighted mean of the cost functions of each experiment.
+
+    Parameters
+    ----------
+    experiments : list of Experiment
+        Experiments used for calibration
+    chis : list of dict
+        Cost functions of each experiment, as returned by compute_weighted_cost
+
+    Returns
+    -------
+    float
+        Overall cost function
+    """
+    total_weight = sum(experiment.weight for experiment in experiments)
+    return sum(experiment.weight * chi['chi'] for experiment, chi in zip(experiments, chis)) / total_weight
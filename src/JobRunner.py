@@ -0,0 +1,329 @@
+import os
+import signal
+import subprocess
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+# Final status of a job
+COMPLETED = 'completed'
+FAILED = 'failed'
+TIMEOUT = 'timeout'
+CANCELLED = 'cancelled'
+
+
+class JobBackend(ABC):
+    """
+    Interface for submitting PRISMS-Plasticity runs and tracking their completion.
+    """
+
+    @abstractmethod
+    def submit(self, prm_name):
+        """
+        Submit a simulation.
+
+        Parameters
+        ----------
+        prm_name : str
+            Path to the prm file of the simulation
+
+        Returns
+        -------
+        object
+            Handle of the job, passed to poll() and cancel()
+        """
+
+    @abstractmethod
+    def poll(self, handle):
+        """
+        Check whether a job is finished.
+
+        Parameters
+        ----------
+        handle : object
+            Handle returned by submit()
+
+        Returns
+        -------
+        int or None
+            Return code of the job (0 if it succeeded), or None if it is still running
+        """
+
+    @abstractmethod
+    def cancel(self, handle):
+        """
+        Kill a running job.
+
+        Parameters
+        ----------
+        handle : object
+            Handle returned by submit()
+        """
+
+
+class LocalBackend(JobBackend):
+    """
+    Run PRISMS-Plasticity as a subprocess of the current machine.
+
+    Parameters
+    ----------
+    command : str
+        Command line used to run PRISMS-Plasticity. The path to the prm file is appended to it.
+    """
+
+    def __init__(self, command):
+        self.command = command
+
+    def submit(self, prm_name):
+        cmd = "{} {}".format(self.command, prm_name)
+        # Start a new session, so that the whole process group (e.g. mpirun and its children) can be killed at once
+        return subprocess.Popen(cmd, shell=True, start_new_session=(os.name == 'posix'))
+
+    def poll(self, handle):
+        return handle.poll()
+
+    def cancel(self, handle):
+        if os.name == 'posix':
+            try:
+                os.killpg(handle.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        else:
+            handle.kill()
+        handle.wait()
+
+
+class SlurmBackend(JobBackend):
+    """
+    Submit PRISMS-Plasticity runs to the Slurm workload manager.
+
+    Parameters
+    ----------
+    batch_file : str
+        Path to batch file to use for submitting a job. The path to the prm file is passed as its first argument.
+    """
+
+    def __init__(self, batch_file):
+        self.batch_file = batch_file
+
+    def submit(self, prm_name):
+        out = subprocess.run(['sbatch', '--parsable', self.batch_file, prm_name],
+                             check=True, capture_output=True, text=True).stdout
+        # With --parsable, sbatch returns "jobid" or "jobid;cluster"
+        return out.strip().split(';')[0]
+
+    def poll(self, handle):
+        squeue = subprocess.run(['squeue', '-h', '-j', handle, '-o', '%T'], capture_output=True, text=True)
+        if squeue.returncode == 0 and squeue.stdout.strip():
+            return None
+        # The job has left the queue: ask the accounting database how it ended
+        sacct = subprocess.run(['sacct', '-n', '-X', '-P', '-j', handle, '-o', 'State'],
+                               capture_output=True, text=True)
+        states = sacct.stdout.split()
+        if sacct.returncode != 0 or not states:
+            # Accounting is not available: the cost function will tell whether the simulation has failed
+            return 0
+        if states[0] in ('PENDING', 'RUNNING', 'COMPLETING', 'CONFIGURING', 'REQUEUED', 'RESIZING', 'SUSPENDED'):
+            return None
+        return 0 if states[0] == 'COMPLETED' else 1
+
+    def cancel(self, handle):
+        subprocess.run(['scancel', handle])
+
+
+class FakeBackend(JobBackend):
+    """
+    Do not run anything, just print the command which would have been executed. This backend stands in for the real
+    ones for debugging and testing.
+
+    Parameters
+    ----------
+    command : str
+        Command to print. The path to the prm file is appended to it.
+    duration : float, optional
+        Time (in seconds) before each fake job is considered as finished. The default is 0.
+    return_code : int, optional
+        Return code of every fake job. The default is 0.
+    """
+
+    def __init__(self, command, duration=0., return_code=0):
+        self.command = command
+        self.duration = duration
+        self.return_code = return_code
+        self.submitted = []
+        self.cancelled = []
+
+    def submit(self, prm_name):
+        cmd = "{} {}".format(self.command, prm_name)
+        print(cmd)
+        self.submitted.append(cmd)
+        return len(self.submitted) - 1, time.monotonic()
+
+    def poll(self, handle):
+        if handle[0] in self.cancelled:
+            return -1
+        if time.monotonic() - handle[1] >= self.duration:
+            return self.return_code
+        return None
+
+    def cancel(self, handle):
+        self.cancelled.append(handle[0])
+
+
+class JobRunner:
+    """
+    Submit many PRISMS-Plasticity runs at once, and track their completion in background threads.
+
+    Parameters
+    ----------
+    backend : JobBackend
+        Backend used for running the simulations
+    max_concurrent : int, optional
+        Maximum number of jobs in flight. The default is 16.
+    retries : int, optional
+        Number of times a failed (or timed out) job is resubmitted. The default is 0.
+    timeout : float, optional
+        Time (in seconds) after which a job is killed. The default is None (no time limit).
+    poll_interval : float, optional
+        Time (in seconds) between two checks of the job status. The default is 5.
+
+    Attributes
+    ----------
+    timings : dict
+        Time (in seconds) spent by each finished job waiting for a free slot, then running (including the time spent
+        in the queue of the workload manager, if any). It is indexed by the paths to the prm files.
+    """
+
+    def __init__(self, backend, max_concurrent=16, retries=0, timeout=None, poll_interval=5.):
+        self.backend = backend
+        self.retries = retries
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.timings = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent)
+
+    def _run(self, prm_name, monitor, submitted):
+        started = time.monotonic()
+        for _ in range(self.retries + 1):
+            status = self._run_once(prm_name, monitor)
+            if status in (COMPLETED, CANCELLED):
+                break
+        self.timings[prm_name] = {'waiting for slot': started - submitted, 'running': time.monotonic() - started}
+        return status
+
+    def _run_once(self, prm_name, monitor):
+        try:
+            handle = self.backend.submit(prm_name)
+        except (OSError, subprocess.SubprocessError) as error:
+            # E.g. sbatch has rejected the job: it may be accepted if submitted again
+            print('Submission of {} has failed: {}'.format(prm_name, error))
+            return FAILED
+        start = time.monotonic()
+        while True:
+            try:
+                return_code = self.backend.poll(handle)
+                stop = return_code is None and monitor is not None and monitor()
+            except Exception as error:
+                # Never leave the job running unattended
+                print('Tracking of {} has failed: {}'.format(prm_name, error))
+                self._cancel(handle)
+                return FAILED
+            if return_code is not None:
+                return COMPLETED if return_code == 0 else FAILED
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                self.backend.cancel(handle)
+                return TIMEOUT
+            if stop:
+                self.backend.cancel(handle)
+                return CANCELLED
+            time.sleep(self.poll_interval)
+
+    def _cancel(self, handle):
+        try:
+            self.backend.cancel(handle)
+        except Exception as error:
+            print('The job cannot be cancelled: {}'.format(error))
+
+    def submit(self, prm_name, monitor=None):
+        """
+        Submit a simulation, without waiting for it to finish.
+
+        Parameters
+        ----------
+        prm_name : str
+            Path to the prm file of the simulation
+        monitor : callable, optional
+            Function called each time the job is polled. If it returns True, the job is killed. The default is None.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future whose result is the final status of the job (COMPLETED, FAILED, TIMEOUT or CANCELLED)
+        """
+        return self._executor.submit(self._run, prm_name, monitor, time.monotonic())
+
+    def run_all(self, prm_names):
+        """
+        Submit many simulations at once, and wait until all of them are finished.
+
+        Parameters
+        ----------
+        prm_names : list of str
+            Paths to the prm files of the simulations
+
+        Returns
+        -------
+        list of str
+            Final status of each job
+        """
+        futures = [self.submit(prm_name) for prm_name in prm_names]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        """
+        Wait for the pending jobs, then release the threads.
+        """
+        self._executor.shutdown(wait=True)
+
+
+def job_runner_from_config(config):
+    """
+    Create a job runner from the [PRISMS], [Slurm], [Jobs] and [Debug] sections of the configuration.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+
+    Returns
+    -------
+    JobRunner
+        Job runner
+    """
+    use_slurm = config.has_option('Slurm', 'use Slurm') and config.getboolean('Slurm', 'use Slurm')
+    if use_slurm:
+        batch_file = config['Slurm']['batch file']
+    fake = config.has_option('Debug', 'fake simulations') and config.getboolean('Debug', 'fake simulations')
+    if fake:
+        if use_slurm:
+            backend = FakeBackend("sbatch --wait {}".format(batch_file))
+        else:
+            backend = FakeBackend(config['PRISMS']['prisms command line'])
+    elif use_slurm:
+        backend = SlurmBackend(batch_file)
+    else:
+        backend = LocalBackend(config['PRISMS']['prisms command line'])
+
+    kwargs = {}
+    if config.has_option('Jobs', 'max concurrent jobs'):
+        kwargs['max_concurrent'] = config.getint('Jobs', 'max concurrent jobs')
+    if config.has_option('Jobs', 'retries'):
+        kwargs['retries'] = config.getint('Jobs', 'retries')
+    if config.has_option('Jobs', 'timeout'):
+        kwargs['timeout'] = config.getfloat('Jobs', 'timeout')
+    if config.has_option('Jobs', 'poll interval'):
+        kwargs['poll_interval'] = config.getfloat('Jobs', 'poll interval')
+    elif not use_slurm:
+        # Local processes are cheap to poll
+        kwargs['poll_interval'] = 0.5
+    return JobRunner(backend, **kwargs)
@@ -9,16 +9,49 @@ import importlib
 import json
 import os
 import shutil
+import time
+from concurrent.futures import as_completed
 
 import numpy as np
-import pandas as pd
 
-from CfgGenerator import CfgGenerator
-from ComputeCostFunctions import compute_weighted_cost, unpack_str_list
+from Archive import ResultArchive, archive_folder
+from CfgGenerator import CfgGeneratorBatch, TemplateSet, copy_back_folder, remove_tree
+from ComputeCostFunctions import ExperimentalDataset, compute_weighted_cost, read_displacements, unpack_str_list
+from EarlyTermination import CostMonitor, StencilMonitor, termination_threshold
+from EvaluationLog import EvaluationLog, is_penalized
+from Experiments import combine_costs, experiment_name, read_experiments
+from JobRunner import CANCELLED, COMPLETED, TIMEOUT, job_runner_from_config
+from Profiling import add_time, annotate, profiler_from_config, stage
+from Surrogate import surrogate_from_config
+from WarmStart import checkpoint_cache_from_config
 
 file_dir = os.path.dirname(__file__)
 version = '1.1.0'
 
+# Evaluation logs opened by the current process, indexed by absolute file path
+_evaluation_logs = {}
+
+# Job runners used by the current process, indexed by absolute path to log file
+_job_runners = {}
+
+# Experimental data loaded by the current process, indexed by absolute path to log file and experiment name
+_datasets = {}
+
+# Surrogate models used by the current process, indexed by absolute path to log file
+_surrogates = {}
+
+# Archives of results used by the current process, indexed by absolute path to log file and experiment name
+_archives = {}
+
+# Profilers used by the current process, indexed by absolute path to log file
+_profilers = {}
+
+# Templates read by the current process, indexed by absolute path to log file and experiment name
+_templates = {}
+
+# Caches of checkpoint files used by the current process, indexed by absolute path to log file and experiment name
+_checkpoint_caches = {}
+
 
 def parse_optional_param(config, section):
     if config.has_section(section):
@@ -39,6 +72,185 @@ def read_bounds(config):
     return lb, ub
 
 
+def read_eps_jac(config):
+    # Find the absolute step size used for computing the gradient (wrt. normalized parameters)
+    if config.has_option('Minimize', 'eps'):
+        return float(config['Minimize']['eps'])
+    else:
+        # It seems that the default value for the absolute tolerance is 1e-8
+        return 1e-8
+
+
+def get_evaluation_log(config):
+    """
+    Return the log of evaluations defined in the configuration. The log file is only read once per process.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+
+    Returns
+    -------
+    EvaluationLog
+        Indexed log of evaluations
+    """
+    logfile = os.path.abspath(config['Log File']['file path'])
+    if logfile not in _evaluation_logs:
+        lb, ub = read_bounds(config)
+        eps_jac = read_eps_jac(config)
+        chi_names = [name for experiment in read_experiments(config) for name in experiment.chi_names] + ['chi']
+        col_names = list(config['Initial Guess'].keys()) + chi_names
+        _evaluation_logs[logfile] = EvaluationLog(logfile, col_names, lb, ub, atol=eps_jac / 10)
+    return _evaluation_logs[logfile]
+
+
+def get_job_runner(config):
+    """
+    Return the job runner used for running the simulations. It is only created once per process.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+
+    Returns
+    -------
+    JobRunner.JobRunner
+        Job runner
+    """
+    logfile = os.path.abspath(config['Log File']['file path'])
+    if logfile not in _job_runners:
+        _job_runners[logfile] = job_runner_from_config(config)
+    return _job_runners[logfile]
+
+
+def get_dataset(config):
+    """
+    Return the experimental data used for computing the cost functions. It is only loaded once per process.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data of an experiment (see Experiments.read_experiments)
+
+    Returns
+    -------
+    ComputeCostFunctions.ExperimentalDataset
+        Experimental data
+    """
+    key = (os.path.abspath(config['Log File']['file path']), experiment_name(config))
+    if key not in _datasets:
+        _datasets[key] = ExperimentalDataset(config)
+    return _datasets[key]
+
+
+def get_archive(config):
+    """
+    Return the archive where the surface displacements and the stress-strain curves are kept. It is only opened once
+    per process.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data of an experiment (see Experiments.read_experiments)
+
+    Returns
+    -------
+    Archive.ResultArchive or None
+        Archive, or None if archiving is disabled
+    """
+    key = (os.path.abspath(config['Log File']['file path']), experiment_name(config))
+    if key not in _archives:
+        folder = archive_folder(config)
+        _archives[key] = None if folder is None else ResultArchive(folder)
+    return _archives[key]
+
+
+def get_profiler(config):
+    """
+    Return the profiler recording the time spent in each stage of the evaluations. It is only created once per process.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+
+    Returns
+    -------
+    Profiling.Profiler or None
+        Profiler, or None if profiling is disabled
+    """
+    logfile = os.path.abspath(config['Log File']['file path'])
+    if logfile not in _profilers:
+        _profilers[logfile] = profiler_from_config(config)
+    return _profilers[logfile]
+
+
+def get_templates(config):
+    """
+    Return the templates used for generating the configuration files of PRISMS-Plasticity. They are only read once per
+    process.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data of an experiment (see Experiments.read_experiments)
+
+    Returns
+    -------
+    CfgGenerator.TemplateSet
+        Templates
+    """
+    key = (os.path.abspath(config['Log File']['file path']), experiment_name(config))
+    if key not in _templates:
+        _templates[key] = TemplateSet.from_config(config)
+    return _templates[key]
+
+
+def get_surrogate(config):
+    """
+    Return the surrogate model of the cost function, updated with the latest rows of the log file.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+
+    Returns
+    -------
+    Surrogate.GaussianProcessSurrogate or None
+        Surrogate model, or None if it is disabled
+    """
+    logfile = os.path.abspath(config['Log File']['file path'])
+    if logfile not in _surrogates:
+        _surrogates[logfile] = surrogate_from_config(config, len(config['Initial Guess']))
+    surrogate = _surrogates[logfile]
+    if surrogate is not None:
+        surrogate.update_from_log(get_evaluation_log(config), penalty=config.getfloat('Cost Function', 'penalty'))
+    return surrogate
+
+
+def get_checkpoint_cache(config):
+    """
+    Return the cache of checkpoint files used for warm-starting the simulations. It is only created once per process.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data of an experiment (see Experiments.read_experiments)
+
+    Returns
+    -------
+    WarmStart.CheckpointCache or None
+        Checkpoint cache, or None if warm start is disabled
+    """
+    key = (os.path.abspath(config['Log File']['file path']), experiment_name(config))
+    if key not in _checkpoint_caches:
+        _checkpoint_caches[key] = checkpoint_cache_from_config(config)
+    return _checkpoint_caches[key]
+
+
 def remove_data(path, debug=True):
     if not os.path.isfile(path):
         path = os.path.join(path, '')
@@ -49,7 +261,7 @@ def remove_data(path, debug=True):
             os.remove(path)
         else:
             try:
-                shutil.rmtree(path)
+                remove_tree(os.path.normpath(path))
             except OSError as e:
                 print("Error: %s - %s." % (e.filename, e.strerror))
 
@@ -110,6 +322,14 @@ def optimize(config_file='Config.ini'):
     if len(ub) != len(x0):
         raise ValueError(error_msg.format('lower'))
 
+    # Load experimental data once and for all
+    experiments = read_experiments(config)
+    for experiment in experiments:
+        get_dataset(experiment.config)
+
+        # Check the templates before running any simulation
+        get_templates(experiment.config).validate(list(config['Initial Guess'].keys()))
+
     # The minimizer uses absolute differences to compute the gradient. Hence
     # it is a good habit to normalize the parameters so that the investigated 
     # space is an hypercube of size 1.
@@ -119,18 +339,49 @@ def optimize(config_file='Config.ini'):
     # Read L-BFGS-B options
     minimize_opt = parse_optional_param(config, 'Minimize')
     kwargs = {'bounds': boundsn, 'args': config, 'options': minimize_opt}
-    if config.has_section('Minimize parallel') and config.getboolean('Minimize parallel', 'use parallel minimizer'):
+    use_parallel = config.has_section('Minimize parallel') and config.getboolean('Minimize parallel',
+                                                                                  'use parallel minimizer')
+    batched = config.has_option('Jobs', 'batched gradient') and config.getboolean('Jobs', 'batched gradient')
+    fun = run_and_compare
+    if use_parallel and batched:
+        raise ValueError('The parallel minimizer cannot be used together with batched gradient evaluation.')
+    elif use_parallel:
         config['Minimize parallel'].pop('use parallel minimizer')
         kwargs['parallel'] = parse_optional_param(config, 'Minimize parallel')
+        for section, option in (('Surrogate', 'use surrogate'), ('Early Termination', 'use early termination'),
+                                ('Warm Start', 'use warm start')):
+            if config.has_option(section, option) and config.getboolean(section, option):
+                # The points needed for the gradient are evaluated concurrently, by separate processes: they cannot be
+                # told apart from the base point, and the checkpoints they use cannot be protected from eviction
+                print('[{}] is disabled, since it cannot be used with the parallel minimizer.'.format(section))
+                config[section][option] = 'No'
         module = importlib.import_module('optimparallel')
         minimizer = module.minimize_parallel
     else:
         module = importlib.import_module('scipy.optimize')
         minimizer = module.minimize
+        if batched:
+            # The objective function returns both the cost function and its gradient
+            fun = run_and_compare_with_gradient
+            kwargs['jac'] = True
 
     print('Launch optimization...')
-    res = minimizer(run_and_compare, x0n, **kwargs)
+    start = time.time()
+    res = minimizer(fun, x0n, **kwargs)
     print("...Done!")
+    profiler = get_profiler(config)
+    if profiler is not None:
+        print_title('Time spent in each stage of the evaluations:')
+        print(profiler.summary(since=start))
+        print('See {} for details.'.format(profiler.file_path))
+    surrogate = get_surrogate(config)
+    if surrogate is not None:
+        print('The surrogate model has saved {} simulation(s).'.format(surrogate.n_saved))
+        res.surrogate_saved = surrogate.n_saved
+    checkpoints = [get_checkpoint_cache(experiment.config) for experiment in experiments]
+    if checkpoints[0] is not None:
+        res.warm_starts = sum(cache.n_warm_starts for cache in checkpoints)
+        print('{} simulation(s) have been warm-started.'.format(res.warm_starts))
 
     # Restore the optimized parameters into un-normalized form
     k = ub - lb
@@ -165,79 +416,257 @@ def run_and_compare(pn, config):
         Scalarized cost function to be minimized
 
     """
+    return run_and_compare_batch([pn], config)[0]
+
+
+def run_and_compare_batch(pns, config, bases=None):
+    """
+    Same as run_and_compare, but for many sets of parameters at once. All the simulations which have not been run
+    before are submitted together (one per set of parameters and per experiment), then the cost functions are computed
+    as soon as the simulations are finished.
+
+    Parameters
+    ----------
+    pns : list of numpy.ndarray
+        Normalized arrays of parameters to be used for PRISMS-Plasticity
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+    bases : list, optional
+        For each array of parameters, index of the base point (in pns) if it is a finite-difference step away from
+        it, or None. If not given (default), the base points are looked for in the log file.
+
+    Returns
+    -------
+    list of float
+        Scalarized cost functions related to each array of parameters
+
+    """
+    profiler = get_profiler(config)
+    if profiler is None:
+        return _run_and_compare_batch(pns, config, bases)
+    with profiler.evaluation(n_points=len(pns)):
+        return _run_and_compare_batch(pns, config, bases)
+
+
+def _run_and_compare_batch(pns, config, bases):
     # Restore the parameters into their initial (un-normalized) form
     lb, ub = read_bounds(config)
     dom_size = ub - lb
-    p = lb + pn * dom_size
-    n_p = len(p)
 
-    # Find the absolute tolerance of normalized parameters
-    if config.has_option('Minimize', 'eps'):
-        eps_jac = float(config['Minimize']['eps'])
-    else:
-        # It seems that the default value for the absolute tolerance is 1e-8
-        eps_jac = 1e-8
-
-    # First, look in log file if this simulation has been run before
-    logfile = config['Log File']['file path']
-    chi_names = ['chi_u', 'chi_f', 'chi']
-    col_names = list(config['Initial Guess'].keys()) + chi_names
-    try:
-        # Try to read log file
-        prev = pd.read_csv(logfile)
-        if prev.size == 0:
-            # Only the header is present
-            cost = np.array([])
+    log = get_evaluation_log(config)
+    runner = get_job_runner(config)
+    experiments = read_experiments(config)
+    threshold = termination_threshold(config, log)
+    surrogate = get_surrogate(config)
+    penalty = config.getfloat('Cost Function', 'penalty')
+    eps_jac = read_eps_jac(config)
+    chi_names = [name for experiment in experiments for name in experiment.chi_names]
+    look_for_bases = bases is None
+    if look_for_bases:
+        bases = [None] * len(pns)
+    costs = [None] * len(pns)
+    penalized = [False] * len(pns)
+    stencil = [b is not None for b in bases]  # Whether each point is a finite-difference step away from its base
+    base_values = {}  # Cost function of base points found in the log file, and whether it is a penalty
+    anchored_later = []  # Points predicted by the surrogate model, whose base point is simulated
+    to_run = []
+    for i, pn in enumerate(pns):
+        p = lb + pn * dom_size
+
+        # First, look in log file if this simulation has been run before
+        with stage('log lookup'):
+            prev = log.lookup(p)
+            if prev is None and look_for_bases:
+                # Sequential estimation of the gradient: the base point has been evaluated just before
+                base_row = log.lookup_neighbour(p, eps_jac)
+                if base_row is not None:
+                    stencil[i] = True
+                    base_values[i] = (base_row['chi'], is_penalized([base_row[name] for name in chi_names], penalty))
+                    base_pn = log.normalize([base_row[name] for name in config['Initial Guess'].keys()])
+        if prev is not None:
+            # If the simulation was run before, just use the related cost function
+            costs[i] = prev['chi']
+            penalized[i] = is_penalized([prev[name] for name in chi_names], penalty)
+            continue
+        if stencil[i]:
+            if bases[i] is None:
+                anchor = (base_pn,) + base_values[i]
+            else:
+                anchor = (pns[bases[i]], costs[bases[i]], penalized[bases[i]])
+            if anchor[2]:
+                # The derivative is set to zero below, so that no gradient is computed against a penalty value
+                continue
         else:
-            mat = prev.to_numpy()
-            matn = (mat[:, :n_p] - lb) / dom_size
-            existing = np.all(np.isclose(matn, pn, atol=eps_jac / 10, rtol=0.), axis=1)
-            cost = mat[existing, -1]
-    except (pd.errors.EmptyDataError, FileNotFoundError):
-        cost = np.array([])
-
-    if cost.size != 0:
-        # If the simulation was run before, just return the related cost function
-        return cost[0]
-    else:
-        # Otherwise, run this simulation and compute the cost function
-        # Generate a dictionary from the parameters
-        d = dict(zip(config['Initial Guess'].keys(), p))
-        prm_name, lh_name, fname = CfgGenerator(d, config)
-
-        # Run simulation and wait till the end
-        if config.has_option('Slurm', 'use Slurm') and config.getboolean('Slurm', 'use Slurm'):
-            # Use SLURM workload manager
-            batch_file = config['Slurm']['batch file']
-            cmd = "sbatch --wait {} {}".format(batch_file, prm_name)
+            anchor = None
+
+        prediction = None
+        if surrogate is not None and stencil[i]:
+            # The surrogate model only answers finite-difference steps, whose base point is simulated: the points
+            # accepted by the minimizer (base points, line search, optimum) never rest on a prediction. It only
+            # predicts the difference with the base point, so that simulated and predicted cost functions are never
+            # mixed up in the gradient
+            # If the base point is simulated in this batch, the prediction is only checked for now, and anchored below
+            with stage('surrogate'):
+                prediction = surrogate.query(pn, anchor=(anchor[0], 0. if anchor[1] is None else anchor[1]))
+            if prediction is not None and anchor[1] is None:
+                anchored_later.append(i)
+        if prediction is not None:
+            # The surrogate model is accurate enough around these parameters: no need to run the simulation
+            costs[i] = prediction
         else:
-            # Run PRISMS directly
-            bin_path = config['PRISMS']['prisms command line']
-            cmd = "{} {}".format(bin_path, prm_name)
-
-        if config.has_option('Debug', 'fake simulations') and config.getboolean('Debug', 'fake simulations'):
-            execute = print
+            # Otherwise, the simulations must be run
+            to_run.append((i, pn, p))
+
+    # Generate the configuration files of all the simulations, then submit them (one simulation per experiment)
+    pending = {}
+    results = {i: [None] * len(experiments) for i, _, _ in to_run}  # Cost functions of each experiment
+    archived = {i: [None] * len(experiments) for i, _, _ in to_run}  # Results to archive for each experiment
+    total_weight = sum(experiment.weight for experiment in experiments)
+    base_monitors = {i: [] for i, _, _ in to_run}
+    for k, experiment in enumerate(experiments):
+        checkpoints = get_checkpoint_cache(experiment.config)
+        restarts = [None if checkpoints is None else checkpoints.acquire(pn) for _, pn, _ in to_run]
+        restart_folders = [None if restart is None else checkpoints.path(restart) for restart in restarts]
+        ds = [dict(zip(config['Initial Guess'].keys(), p)) for _, _, p in to_run]
+        with stage('templates'):
+            generated = CfgGeneratorBatch(ds, experiment.config, restart_folders=restart_folders,
+                                          templates=get_templates(experiment.config))
+        data = get_dataset(experiment.config)
+        for (i, pn, p), restart, (prm_name, lh_name, fname, workdir) in zip(to_run, restarts, generated):
+            if data.dic_time_steps is None or checkpoints is not None:
+                # The DIC time steps may be parametrized: check them before running anything
+                time_steps = data.time_steps(fname)
+                if checkpoints is not None and len(time_steps) and checkpoints.restart_step >= min(time_steps):
+                    raise ValueError('The restart step ({}) must precede the first DIC time step ({}).'.format(
+                        checkpoints.restart_step, min(time_steps)))
+            if restart is not None:
+                # The outputs preceding the checkpoint are not written again by the restarted simulation
+                with stage('checkpoints'):
+                    checkpoints.seed(restart, fname)
+            if threshold is None:
+                monitor = None
+            elif stencil[i]:
+                # Finite-difference steps are only stopped along with their base point
+                monitor = StencilMonitor(base_monitors[bases[i]]) if bases[i] in base_monitors else None
+            else:
+                # Stop the simulation as soon as its share of the overall cost function is obviously worse than
+                # the best one so far
+                monitor = CostMonitor(fname, get_dataset(experiment.config),
+                                      threshold * total_weight / experiment.weight)
+                base_monitors[i].append(monitor)
+            job = runner.submit(prm_name, monitor=monitor)
+            pending[job] = (i, k, pn, p, prm_name, workdir, fname, restart)
+    annotate(n_simulations=len(pending))
+
+    debug = config.has_option('Debug', 'fake deletions') and config.getboolean('Debug', 'fake deletions')
+    copy_back = copy_back_folder(config)
+    dropped = set()
+    for job in as_completed(pending):
+        # Compute the cost function once the simulation is finished
+        i, k, pn, p, prm_name, workdir, fname, restart = pending[job]
+        experiment = experiments[k]
+        data = get_dataset(experiment.config)
+        checkpoints = get_checkpoint_cache(experiment.config)
+        status = job.result()
+        for name, duration in runner.timings.pop(prm_name, {}).items():
+            # Summed over all the simulations, even if they run concurrently
+            add_time(name, duration)
+        if status != COMPLETED:
+            # The outputs of a killed or failed simulation may be truncated: they are not read at all
+            if status == CANCELLED and stencil[i]:
+                print('{} stopped along with its base point.'.format(fname))
+            elif status == CANCELLED:
+                print('{} stopped: its cost function is already above the threshold.'.format(fname))
+            elif status == TIMEOUT:
+                print('{} killed: it has exceeded the time limit.'.format(fname))
+            else:
+                print('{} has failed.'.format(fname))
+            chis = {'chi_u': data.penalty, 'chi_f': data.penalty, 'chi': data.penalty}
+        else:
+            with stage('cost function'):
+                # The displacements are read once, for both the cost function and the archive
+                displacements = read_displacements(fname, data)
+                chis = compute_weighted_cost(fname, data, displacements=displacements)
+            if get_archive(experiment.config) is not None:
+                with stage('archive'):
+                    archived[i][k] = ResultArchive.extract(fname, data, displacements=displacements)
+
+        # Keep the checkpoint files for warm-starting the next simulations. They are copied instead of moved if the
+        # working directory must be copied back whole
+        if checkpoints is not None:
+            with stage('checkpoints'):
+                checkpoints.release(restart)
+                if status == COMPLETED and os.path.isdir(fname):
+                    checkpoints.add(pn, fname, move=not debug and copy_back is None)
+
+        # Copy the working directory back (e.g. from node-local storage), then remove conf files and results
+        with stage('cleanup'):
+            if copy_back is not None:
+                destination = os.path.join(copy_back, os.path.basename(fname))
+                if os.path.isdir(destination):
+                    remove_tree(destination)
+                shutil.copytree(workdir, destination)
+            remove_data(workdir, debug=debug)
+
+        # Once all the experiments are done, append the cost functions to the log file
+        results[i][k] = chis
+        if status == CANCELLED and stencil[i]:
+            # Stopped along with its base point: this cost function is not relevant, and must not be logged
+            dropped.add(i)
+        if i not in dropped and all(chi is not None for chi in results[i]):
+            chi = combine_costs(experiments, results[i])
+            penalized[i] = is_penalized([value for chis in results[i] for value in chis.values()], penalty)
+            values = [value for e, chis in zip(experiments, results[i]) for value in e.log_values(chis)]
+            with stage('log writing'):
+                row = log.append(np.concatenate((p, np.array(values + [chi]))))
+
+            # Archive the results, using the index of the row in the log file as key
+            for e, fields in zip(experiments, archived.pop(i)):
+                if fields is not None:
+                    with stage('archive'):
+                        get_archive(e.config).write(row, fields)
+            costs[i] = chi
+
+    # A finite-difference step involving a penalty value (on either side) gets the cost function of its base point,
+    # i.e. a null derivative. Those predicted by the surrogate model are anchored to the cost function of their base.
+    for i in range(len(pns)):
+        if not stencil[i]:
+            continue
+        if bases[i] is None:
+            base_cost, base_penalized = base_values[i]
         else:
-            execute = os.system
-        execute(cmd)
-
-        # Compute the cost function
-        chis = compute_weighted_cost(fname, config)
-
-        # Remove conf files and results
-        debug = config.has_option('Debug', 'fake deletions') and config.getboolean('Debug', 'fake deletions')
-        remove_data(lh_name, debug=debug)
-        remove_data(prm_name, debug=debug)
-        remove_data(fname, debug=debug)
-
-        # Append the cost functions to the log file
-        a = np.concatenate((p, np.array([chis['chi_u'], chis['chi_f'], chis['chi']])))
-        df = pd.DataFrame(data=[a], columns=col_names)
-        try:
-            _ = pd.read_csv(logfile)
-            df.to_csv(logfile, index=False, header=False, mode='a')
-        except (pd.errors.EmptyDataError, FileNotFoundError):
-            df.to_csv(logfile, index=False)
-
-        # Return the function to be minimized
-        return chis['chi']
+            base_cost, base_penalized = costs[bases[i]], penalized[bases[i]]
+        if base_penalized or penalized[i] or costs[i] is None:
+            costs[i] = base_cost
+        elif i in anchored_later:
+            costs[i] = max(base_cost + surrogate.difference(pns[i], pns[bases[i]]), 0.)
+    return costs
+
+
+def run_and_compare_with_gradient(pn, config):
+    """
+    Compute the cost function and its gradient, estimated by forward finite differences. The simulations related to
+    the n+1 points needed for the gradient are all submitted at once.
+
+    Parameters
+    ----------
+    pn : numpy.ndarray
+        Normalized array of parameters to be used for PRISMS-Plasticity
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+
+    Returns
+    -------
+    float
+        Scalarized cost function to be minimized
+    numpy.ndarray
+        Gradient of the cost function, with respect to the normalized parameters
+    """
+    eps_jac = read_eps_jac(config)
+
+    # Perturb each parameter in turn. Use backward differences if the step would go beyond the upper bound.
+    steps = np.where(pn + eps_jac > 1., -eps_jac, eps_jac)
+    pns = [pn] + [pn + steps[k] * np.eye(len(pn))[k] for k in range(len(pn))]
+    costs = run_and_compare_batch(pns, config, bases=[None] + [0] * len(pn))
+    grad = (np.array(costs[1:]) - costs[0]) / steps
+    return costs[0], grad
@@ -0,0 +1,132 @@
+import argparse
+import configparser
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from CfgGenerator import copy_back_folder, scratch_folder, simulation_name
+from ComputeCostFunctions import ExperimentalDataset
+from Experiments import read_experiments
+from vtk_utils import displacement_error_fields, read_mesh, read_pvtu, write_pvd, write_vtu
+
+
+def best_evaluations(config, n_best=1):
+    """
+    Read the log file and return the evaluations with the lowest cost functions.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+    n_best : int, optional
+        Number of evaluations to return. If None, all the logged evaluations are returned. The default is 1.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Evaluations, sorted by increasing cost function
+    """
+    log = pd.read_csv(config['Log File']['file path'])
+    log = log.sort_values('chi', kind='stable')
+    if n_best is not None:
+        log = log.head(n_best)
+    return log
+
+
+def postprocess(config_file='Config.ini', mesh_vtk='mesh.vtk', n_best=1, output_folder='.', max_workers=None):
+    """
+    Write the displacement errors of logged evaluations for every step of DIC measurements. The mesh and the DIC
+    data are only read once, and the steps are processed in parallel threads. For each evaluation, the vtu files of
+    each step are gathered in one time series (pvd file).
+
+    The results of the simulations must be still available (see 'fake deletions' option in [Debug] section). If many
+    experiments are defined, each of them is processed, with its own mesh (if given by the 'mesh' option).
+
+    Parameters
+    ----------
+    config_file : str, optional
+        Path to configuration file used for optimization. The default is 'Config.ini'.
+    mesh_vtk : str, optional
+        Path to mesh file (vtk format), used for experiments which do not define their own mesh. The default is
+        'mesh.vtk'.
+    n_best : int, optional
+        Number of evaluations to process, starting from the lowest cost functions. If None, all the evaluations are
+        processed. The default is 1.
+    output_folder : str, optional
+        Folder where the results are written. The default is '.'.
+    max_workers : int, optional
+        Maximum number of threads. The default is None (see ThreadPoolExecutor).
+
+    Returns
+    -------
+    list of str
+        Paths to written pvd files
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    param_names = list(config['Initial Guess'].keys())
+
+    def process_step(mesh, dic_steps, result_folder, step, step_simu, vtu_file):
+        nodes, u_sim = read_pvtu("{}/solution-{:04}.pvtu".format(result_folder, step_simu))
+        if nodes is None:
+            return False
+        DIC_vals = dic_steps[step]
+        fields = displacement_error_fields(mesh, nodes, u_sim, DIC_vals[:, :2], DIC_vals[:, 2:4], DIC_vals[:, 4])
+        write_vtu(mesh, fields, os.path.join(output_folder, vtu_file))
+        return True
+
+    pvd_files = []
+    os.makedirs(output_folder, exist_ok=True)
+    evaluations = best_evaluations(config, n_best)
+    results_root = copy_back_folder(config) or scratch_folder(config)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for experiment in read_experiments(config):
+            # Read data shared by all the evaluations
+            if experiment.config.has_option('Experiment', 'mesh'):
+                mesh = read_mesh(experiment.config['Experiment']['mesh'])
+            else:
+                mesh = read_mesh(mesh_vtk)
+            data = ExperimentalDataset(experiment.config)
+            dic_steps = data.dic_steps
+
+            for _, row in evaluations.iterrows():
+                name = simulation_name(dict(zip(param_names, row[param_names].to_numpy())), experiment.name)
+                fname = os.path.join(results_root, name, name)
+                if not os.path.isdir(fname):
+                    # The working directory may have a suffix, if another process has used the same name
+                    fname = next(iter(sorted(glob.glob(os.path.join(results_root, name + '.*', name)))), fname)
+                if not os.path.isdir(fname):
+                    print('Results of {} not found, skipped.'.format(fname))
+                    continue
+                dic_time_steps = data.time_steps(fname)[:len(dic_steps)]
+                vtu_files = ['{}_Displacement_error_{}.vtu'.format(name, step + 1)
+                             for step in range(len(dic_time_steps))]
+                jobs = [executor.submit(process_step, mesh, dic_steps, fname, step, step_simu, vtu_file)
+                        for step, (step_simu, vtu_file) in enumerate(zip(dic_time_steps, vtu_files))]
+                written = [vtu_file for job, vtu_file in zip(jobs, vtu_files) if job.result()]
+                pvd_file = os.path.join(output_folder, '{}.pvd'.format(name))
+                write_pvd(written, pvd_file)
+                pvd_files.append(pvd_file)
+                print('{} (chi={}) written.'.format(pvd_file, row['chi']))
+    return pvd_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write displacement errors of logged evaluations for every step '
+                                                 'of DIC measurements.')
+    parser.add_argument('config_file', help='Configuration file used for optimization')
+    parser.add_argument('mesh', help='Mesh file (vtk format)')
+    parser.add_argument('-n', '--best', type=int, default=1,
+                        help='Number of evaluations to process, starting from the lowest cost functions (default: 1)')
+    parser.add_argument('-a', '--all', action='store_true', help='Process all the logged evaluations')
+    parser.add_argument('-o', '--output', default='.', help='Output folder (default: current folder)')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='Number of parallel threads')
+    args = parser.parse_args()
+    postprocess(args.config_file, args.mesh, n_best=None if args.all else args.best, output_folder=args.output,
+                max_workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
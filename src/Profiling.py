@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Record of the evaluation being profiled by the current thread (if any)
+_local = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """
+    Measure the wall-clock time spent in a block of code, and add it to the record of the evaluation being profiled by
+    the current thread. Nothing is measured if no evaluation is profiled.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage
+    """
+    record = getattr(_local, 'record', None)
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - start, record)
+
+
+def add_time(name, duration, record=None):
+    """
+    Add a duration to a stage of the evaluation being profiled.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage
+    duration : float
+        Duration (in seconds)
+    record : dict, optional
+        Record of the evaluation. The default is the one being profiled by the current thread.
+    """
+    if record is None:
+        record = getattr(_local, 'record', None)
+        if record is None:
+            return
+    stages = record['stages']
+    stages[name] = stages.get(name, 0.) + duration
+
+
+def annotate(**info):
+    """Add values to the record of the evaluation being profiled by the current thread (if any)."""
+    record = getattr(_local, 'record', None)
+    if record is not None:
+        record.update(info)
+
+
+class Profiler:
+    """
+    Record the wall-clock time spent in each stage of the evaluations (and optionally their peak memory usage), and
+    write them in a JSON-lines file.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to JSON-lines file where the records are appended
+    trace_memory : bool, optional
+        If True, the peak memory allocated by Python (and numpy) during each evaluation is recorded, using tracemalloc.
+        Note that it slows down memory allocations. The default is False.
+    """
+
+    def __init__(self, file_path, trace_memory=False):
+        self.file_path = file_path
+        self.trace_memory = trace_memory
+        self.records = []
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def evaluation(self, **info):
+        """
+        Profile an evaluation run by the current thread. The record is written once the evaluation is over.
+
+        Parameters
+        ----------
+        **info
+            Additional values to write in the record
+
+        Yields
+        ------
+        dict
+            Record of the evaluation
+        """
+        record = dict(info)
+        record['start'] = time.time()
+        record['pid'] = os.getpid()
+        record['stages'] = {}
+        _local.record = record
+        if self.trace_memory:
+            # tracemalloc.reset_peak only exists since Python 3.9
+            getattr(tracemalloc, 'reset_peak', tracemalloc.clear_traces)()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['total'] = time.perf_counter() - start
+            if self.trace_memory:
+                record['peak memory (MB)'] = tracemalloc.get_traced_memory()[1] / 1e6
+            _local.record = None
+            self.records.append(record)
+            with open(self.file_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def summary(self, since=None):
+        """
+        Summarize the records written in the JSON-lines file (including those of other processes).
+
+        Parameters
+        ----------
+        since : float, optional
+            Only account for the evaluations started after this time (as given by time.time()). The default is None.
+
+        Returns
+        -------
+        str
+            Total and mean time spent in each stage, and largest peak memory
+        """
+        records = []
+        if os.path.isfile(self.file_path):
+            with open(self.file_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Line being written by another process
+                        continue
+                    if since is None or record['start'] >= since:
+                        records.append(record)
+        if not records:
+            return 'No evaluation profiled.'
+        totals = {}
+        for record in records:
+            for name, duration in record['stages'].items():
+                totals[name] = totals.get(name, 0.) + duration
+        wall_time = sum(record['total'] for record in records)
+        lines = ['{} evaluation(s) profiled, {:.1f} s in total'.format(len(records), wall_time),
+                 '{:<24}{:>14}{:>14}'.format('Stage', 'Total (s)', 'Mean (s)')]
+        for name, total in sorted(totals.items(), key=lambda item: -item[1]):
+            lines.append('{:<24}{:>14.3f}{:>14.3f}'.format(name, total, total / len(records)))
+        peaks = [record['peak memory (MB)'] for record in records if 'peak memory (MB)' in record]
+        if peaks:
+            lines.append('Largest peak memory: {:.1f} MB'.format(max(peaks)))
+        return '\n'.join(lines)
+
+
+def profiler_from_config(config):
+    """
+    Create a profiler from the [Profiling] section of the configuration. The records are written next to the log file.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+
+    Returns
+    -------
+    Profiler or None
+        Profiler, or None if profiling is disabled
+    """
+    section = 'Profiling'
+    if not (config.has_option(section, 'use profiling') and config.getboolean(section, 'use profiling')):
+        return None
+    trace_memory = config.has_option(section, 'trace memory') and config.getboolean(section, 'trace memory')
+    logfile = os.path.abspath(config['Log File']['file path'])
+    return Profiler(os.path.splitext(logfile)[0] + '_profile.jsonl', trace_memory=trace_memory)
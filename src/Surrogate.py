@@ -0,0 +1,214 @@
+import numpy as np
+from scipy.linalg import solve_triangular
+
+from EvaluationLog import is_penalized
+
+
+class GaussianProcessSurrogate:
+    """
+    Gaussian process regression of the cost function, with respect to the normalized parameters. It is used for
+    answering queries where its predicted uncertainty is low, instead of running simulations.
+
+    The kernel is a squared exponential. The Cholesky factor of the correlation matrix is updated incrementally when
+    new samples are added, so that refitting costs O(n^2) instead of O(n^3). The signal standard deviation is the
+    largest of the standard deviation and the mean magnitude of the samples, so that clustered samples (e.g. close to
+    the optimum) do not make the model overconfident far away from them. The uncertainty is then measured relatively
+    to this scale.
+
+    Parameters
+    ----------
+    length_scale : float, optional
+        Correlation length of the kernel, in normalized parameter space. The default is 0.2.
+    nugget : float, optional
+        Value added to the diagonal of the correlation matrix, for numerical stability. The default is 1e-6.
+    max_rel_std : float, optional
+        Largest predicted standard deviation, relative to the signal standard deviation, for which the surrogate model
+        is trusted. The default is 1e-2.
+    min_samples : int, optional
+        Number of samples below which the surrogate model is never trusted. The default is 10.
+    """
+
+    def __init__(self, length_scale=0.2, nugget=1e-6, max_rel_std=1e-2, min_samples=10):
+        self.length_scale = length_scale
+        self.nugget = nugget
+        self.max_rel_std = max_rel_std
+        self.min_samples = min_samples
+        self.X = None
+        self.y = np.zeros(0)
+        self.L = np.zeros((0, 0))
+        self.n_saved = 0
+        self.n_rows_read = 0
+        self._mean = 0.
+        self._var = 1.
+        self._alpha = np.zeros(0)
+
+    def __len__(self):
+        return len(self.y)
+
+    def _correlation(self, a, b):
+        d2 = np.sum((a[:, np.newaxis, :] - b[np.newaxis, :, :]) ** 2, axis=-1)
+        return np.exp(-0.5 * d2 / self.length_scale ** 2)
+
+    def add_samples(self, X, y):
+        """
+        Add samples to the surrogate model, and refit it.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            n x d array of normalized parameters
+        y : numpy.ndarray
+            Array of length n of cost functions
+        """
+        for x, yi in zip(np.atleast_2d(X), np.atleast_1d(y)):
+            x = x[np.newaxis, :]
+            if self.X is None:
+                self.X = np.zeros((0, x.shape[1]))
+            # Extend the Cholesky factor with the new row
+            n = len(self.y)
+            if n:
+                b = solve_triangular(self.L, self._correlation(self.X, x)[:, 0], lower=True)
+            else:
+                b = np.zeros(0)
+            c2 = 1. + self.nugget - np.dot(b, b)
+            if c2 <= 0.:
+                # The new sample is (numerically) a duplicate: skip it
+                continue
+            L = np.zeros((n + 1, n + 1))
+            L[:n, :n] = self.L
+            L[n, :n] = b
+            L[n, n] = np.sqrt(c2)
+            self.L = L
+            self.X = np.vstack((self.X, x))
+            self.y = np.append(self.y, yi)
+
+        # The mean and variance are re-estimated from all the samples, then the weights are updated in O(n^2)
+        if len(self.y):
+            self._mean = np.mean(self.y)
+            self._var = max(np.var(self.y), np.mean(np.abs(self.y)) ** 2, np.finfo(float).tiny)
+            z = solve_triangular(self.L, self.y - self._mean, lower=True)
+            self._alpha = solve_triangular(self.L.T, z, lower=False)
+
+    def update_from_log(self, log, penalty=None):
+        """
+        Add the rows appended to the log of evaluations since the last update.
+
+        Parameters
+        ----------
+        log : EvaluationLog.EvaluationLog
+            Log of evaluations
+        penalty : float, optional
+            Penalty value. Failed simulations (one of whose cost functions is the penalty) are not used for fitting. The
+            default is None.
+        """
+        log.refresh()
+        rows = log.rows[self.n_rows_read:]
+        self.n_rows_read = len(log.rows)
+        if rows:
+            rows = np.array(rows)
+            n_p = len(log.lb)
+            if penalty is not None:
+                # Every column after the parameters is a cost function
+                rows = rows[[not is_penalized(row[n_p:], penalty) for row in rows]]
+            if len(rows):
+                self.add_samples(log.normalize(rows[:, :n_p]), rows[:, log.header.index('chi')])
+
+    def predict(self, x):
+        """
+        Predict the cost function at given normalized parameters.
+
+        Parameters
+        ----------
+        x : numpy.ndarray
+            Array of normalized parameters
+
+        Returns
+        -------
+        float
+            Predicted cost function (never negative)
+        float
+            Predicted standard deviation
+        """
+        if len(self.y) == 0:
+            return np.nan, np.inf
+        r = self._correlation(self.X, np.atleast_2d(x))[:, 0]
+        mean = max(self._mean + np.dot(r, self._alpha), 0.)
+        v = solve_triangular(self.L, r, lower=True)
+        var = self._var * max(1. + self.nugget - np.dot(v, v), 0.)
+        return mean, np.sqrt(var)
+
+    def difference(self, x, x_ref):
+        """Predict the difference between the cost functions at two sets of normalized parameters."""
+        X = np.vstack((x, x_ref))
+        r = self._correlation(self.X, X)
+        return np.dot(r[:, 0] - r[:, 1], self._alpha)
+
+    def difference_std(self, x, x_ref):
+        """Predict the standard deviation of the difference between the cost functions at two sets of parameters."""
+        X = np.vstack((x, x_ref))
+        r = self._correlation(self.X, X)
+        v = solve_triangular(self.L, r[:, 0] - r[:, 1], lower=True)
+        k = self._correlation(X[:1], X[1:])[0, 0]
+        return np.sqrt(self._var * max(2. * (1. - k) - np.dot(v, v), 0.))
+
+    def query(self, x, anchor=None):
+        """
+        Return the predicted cost function if the surrogate model is trusted at given normalized parameters, i.e. if the
+        predicted standard deviation is lower than max_rel_std times the signal standard deviation. If an anchor is
+        given, the standard deviation of the predicted difference, divided by the distance to the anchor, is used
+        instead (i.e. the uncertainty of the finite-difference derivative).
+
+        Parameters
+        ----------
+        x : numpy.ndarray
+            Array of normalized parameters
+        anchor : tuple, optional
+            Normalized parameters and cost function of a nearby evaluation (e.g. the base point of a finite-difference
+            estimation of the gradient). If given, the prediction is the cost function of this evaluation plus the
+            predicted difference, so that the regression error (e.g. due to the nugget) does not end up in finite
+            differences. The default is None.
+
+        Returns
+        -------
+        float or None
+            Predicted cost function, or None if a simulation is needed
+        """
+        if len(self.y) < self.min_samples:
+            return None
+        if anchor is None:
+            mean, std = self.predict(x)
+        else:
+            mean = max(anchor[1] + self.difference(x, anchor[0]), 0.)
+            std = self.difference_std(x, anchor[0]) / np.linalg.norm(np.asarray(x) - anchor[0])
+        if std < self.max_rel_std * np.sqrt(self._var):
+            self.n_saved += 1
+            return mean
+        return None
+
+
+def surrogate_from_config(config, n_params):
+    """
+    Create a surrogate model from the [Surrogate] section of the configuration.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+    n_params : int
+        Number of optimized parameters
+
+    Returns
+    -------
+    GaussianProcessSurrogate or None
+        Surrogate model, or None if it is disabled
+    """
+    section = 'Surrogate'
+    if not (config.has_option(section, 'use surrogate') and config.getboolean(section, 'use surrogate')):
+        return None
+    kwargs = {'min_samples': 2 * (n_params + 1)}
+    for option, key in (('length scale', 'length_scale'), ('nugget', 'nugget'), ('max relative std', 'max_rel_std')):
+        if config.has_option(section, option):
+            kwargs[key] = config.getfloat(section, option)
+    if config.has_option(section, 'min samples'):
+        kwargs['min_samples'] = config.getint(section, 'min samples')
+    return GaussianProcessSurrogate(**kwargs)
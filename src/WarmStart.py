@@ -0,0 +1,286 @@
+import glob
+import os
+import re
+import shutil
+from collections import OrderedDict
+
+import numpy as np
+
+# File, in each entry of the cache, where the parameters of the related simulation are saved
+PARAMETERS_FILE = 'parameters.npy'
+
+# Subfolder, in each entry of the cache, where the outputs written before the checkpoint are saved
+OUTPUTS_FOLDER = 'outputs'
+
+# Increment number of the pvtu/vtu files written by PRISMS-Plasticity (e.g. solution-0042.pvtu)
+_STEP_REGEX = re.compile(r'solution-(\d+)')
+
+
+class CheckpointCache:
+    """
+    Keep the restart (checkpoint) files of recent simulations, so that new simulations can be started from the
+    checkpoint of the closest set of parameters, instead of from time zero.
+
+    The checkpoint is written at a given increment (the restart step), which must precede the first DIC step:
+    otherwise, the restarted simulation would reproduce the outputs of the simulation it restarts from, and the
+    finite-difference derivatives would be zero.
+
+    Each entry is a subfolder of the cache folder, named after the related simulation. When the total size of the
+    entries exceeds the disk budget, the least recently used ones are deleted. Entries used by running simulations are
+    never deleted. The entries left in the cache folder by a previous run are reused.
+
+    Parameters
+    ----------
+    folder : str
+        Folder where the checkpoint files are stored
+    restart_step : int
+        Increment number at which the checkpoint files are written, and from which the simulations restart
+    max_size : float, optional
+        Disk budget (in bytes). The default is 1e9.
+    patterns : list of str, optional
+        Glob patterns of the checkpoint files, relative to the results folder of a simulation. The default is
+        ['restart*'].
+    output_patterns : list of str, optional
+        Glob patterns of the output files stored along with the checkpoint files, relative to the results folder of a
+        simulation. A simulation restarted from the checkpoint does not write the outputs preceding the checkpoint
+        again: they are copied into its results folder before it starts. Only the outputs up to the restart step are
+        stored (i.e. the pvtu/vtu files of the following increments are skipped, and stressstrain.txt is truncated).
+        The default is ['solution-*', 'stressstrain.txt'].
+    max_distance : float, optional
+        Largest distance (wrt. normalized parameters) between two sets of parameters for a checkpoint to be reused.
+        The default is infinity.
+    """
+
+    def __init__(self, folder, restart_step, max_size=1e9, patterns=None, output_patterns=None, max_distance=np.inf):
+        self.folder = folder
+        self.restart_step = restart_step
+        self.max_size = max_size
+        self.patterns = ['restart*'] if patterns is None else patterns
+        self.output_patterns = ['solution-*', 'stressstrain.txt'] if output_patterns is None else output_patterns
+        self.max_distance = max_distance
+        self.entries = OrderedDict()  # name -> (normalized parameters, size in bytes)
+        self.pinned = {}  # name -> number of running simulations which use this entry
+        self.n_warm_starts = 0
+        os.makedirs(folder, exist_ok=True)
+
+        # Reuse the checkpoints stored by a previous run, from the oldest to the newest
+        stored = []
+        for name in os.listdir(folder):
+            params_file = os.path.join(self.path(name), PARAMETERS_FILE)
+            if os.path.isfile(params_file):
+                stored.append((os.path.getmtime(params_file), name, np.load(params_file)))
+        for _, name, pn in sorted(stored, key=lambda entry: entry[0]):
+            self.entries[name] = (pn, _disk_usage(self.path(name)))
+        self.evict()
+
+    @property
+    def size(self):
+        """Total size (in bytes) of the stored checkpoints."""
+        return sum(size for _, size in self.entries.values())
+
+    def path(self, name):
+        """Return the folder of a given entry."""
+        return os.path.join(os.path.abspath(self.folder), name)
+
+    def nearest(self, pn):
+        """
+        Find the stored checkpoint whose parameters are the closest to given ones.
+
+        Parameters
+        ----------
+        pn : numpy.ndarray
+            Normalized array of parameters
+
+        Returns
+        -------
+        str or None
+            Name of the entry, or None if no checkpoint is close enough
+        """
+        if not self.entries:
+            return None
+        names = list(self.entries.keys())
+        params = np.array([self.entries[name][0] for name in names])
+        dist = np.linalg.norm(params - pn, axis=1)
+        i = np.argmin(dist)
+        if dist[i] > self.max_distance:
+            return None
+        return names[i]
+
+    def seed(self, name, result_folder):
+        """
+        Copy the outputs stored along with a checkpoint into the results folder of a simulation restarted from it.
+
+        Parameters
+        ----------
+        name : str or None
+            Name of the entry
+        result_folder : str
+            Results folder of the new simulation
+        """
+        if name is None:
+            return
+        outputs = os.path.join(self.path(name), OUTPUTS_FOLDER)
+        if not os.path.isdir(outputs):
+            return
+        os.makedirs(result_folder, exist_ok=True)
+        for f in os.listdir(outputs):
+            source = os.path.join(outputs, f)
+            (shutil.copytree if os.path.isdir(source) else shutil.copy2)(source, os.path.join(result_folder, f))
+
+    def acquire(self, pn):
+        """
+        Find the checkpoint to start from, and protect it from eviction until release() is called.
+
+        Parameters
+        ----------
+        pn : numpy.ndarray
+            Normalized array of parameters of the new simulation
+
+        Returns
+        -------
+        str or None
+            Name of the entry, or None if the simulation must start from time zero
+        """
+        name = self.nearest(pn)
+        if name is not None:
+            self.entries.move_to_end(name)
+            self.pinned[name] = self.pinned.get(name, 0) + 1
+            self.n_warm_starts += 1
+        return name
+
+    def release(self, name):
+        """
+        Allow a checkpoint returned by acquire() to be evicted again.
+
+        Parameters
+        ----------
+        name : str or None
+            Name of the entry
+        """
+        if name is None:
+            return
+        self.pinned[name] -= 1
+        if self.pinned[name] == 0:
+            del self.pinned[name]
+        self.evict()
+
+    def add(self, pn, result_folder, move=True):
+        """
+        Store the checkpoint files written by a simulation, along with its outputs.
+
+        Parameters
+        ----------
+        pn : numpy.ndarray
+            Normalized array of parameters of the simulation
+        result_folder : str
+            Results folder of the simulation
+        move : bool, optional
+            If True (default), the files are moved to the cache. Otherwise, they are copied.
+
+        Returns
+        -------
+        bool
+            True if checkpoint files have been found and stored
+        """
+        files = _glob(result_folder, self.patterns)
+        if not files:
+            return False
+        name = os.path.basename(os.path.normpath(result_folder))
+        if name in self.entries:
+            self._remove(name)
+        dest = self.path(name)
+        outputs = os.path.join(dest, OUTPUTS_FOLDER)
+        os.makedirs(outputs, exist_ok=True)
+        size = 0
+        for f, folder in [(f, dest) for f in files] + [(f, outputs) for f in _glob(result_folder, self.output_patterns)
+                                                       if f not in files]:
+            target = os.path.join(folder, os.path.basename(f))
+            step = _STEP_REGEX.match(os.path.basename(f))
+            if folder == outputs and step is not None and int(step.group(1)) > self.restart_step:
+                # Written again by the simulations restarted from this checkpoint
+                continue
+            if folder == outputs and os.path.basename(f) == 'stressstrain.txt':
+                # Header, then one line per increment
+                _copy_lines(f, target, self.restart_step + 2)
+            elif move:
+                shutil.move(f, target)
+            else:
+                (shutil.copytree if os.path.isdir(f) else shutil.copy2)(f, target)
+            size += _disk_usage(target)
+        pn = np.array(pn, dtype=float)
+        np.save(os.path.join(dest, PARAMETERS_FILE), pn)
+        self.entries[name] = (pn, size)
+        self.evict()
+        return name in self.entries
+
+    def evict(self):
+        """
+        Delete the least recently used checkpoints until the disk budget is met.
+        """
+        for name in list(self.entries.keys()):
+            if self.size <= self.max_size:
+                break
+            if name not in self.pinned:
+                self._remove(name)
+
+    def _remove(self, name):
+        del self.entries[name]
+        shutil.rmtree(self.path(name), ignore_errors=True)
+
+
+def _glob(folder, patterns):
+    return sorted(set(f for pattern in patterns for f in glob.glob(os.path.join(folder, pattern))))
+
+
+def _copy_lines(source, target, n_lines):
+    with open(source, 'rb') as f_in, open(target, 'wb') as f_out:
+        for _, line in zip(range(n_lines), f_in):
+            f_out.write(line)
+
+
+def _disk_usage(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def checkpoint_cache_from_config(config):
+    """
+    Create a checkpoint cache from the [Warm Start] section of the configuration.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        Configuration data, parsed by configparser
+
+    Returns
+    -------
+    CheckpointCache or None
+        Checkpoint cache, or None if warm start is disabled
+    """
+    section = 'Warm Start'
+    if not (config.has_option(section, 'use warm start') and config.getboolean(section, 'use warm start')):
+        return None
+    if not config.has_option(section, 'restart step'):
+        raise ValueError('The restart step must be given in [Warm Start] section.')
+    restart_step = config.getint(section, 'restart step')
+    if config.has_option(section, 'checkpoint folder'):
+        folder = config[section]['checkpoint folder']
+    else:
+        logfile = config['Log File']['file path']
+        folder = os.path.join(os.path.dirname(os.path.abspath(logfile)), 'checkpoints')
+    if config.has_option('Experiment', 'name'):
+        # Checkpoints of different experiments cannot be mixed
+        folder = os.path.join(folder, config['Experiment']['name'])
+    # Neither can checkpoints written at different steps
+    folder = os.path.join(folder, 'step_{}'.format(restart_step))
+    kwargs = {}
+    if config.has_option(section, 'max size'):
+        kwargs['max_size'] = config.getfloat(section, 'max size') * 1e6
+    if config.has_option(section, 'checkpoint files'):
+        kwargs['patterns'] = config[section]['checkpoint files'].split()
+    if config.has_option(section, 'output files'):
+        kwargs['output_patterns'] = config[section]['output files'].split()
+    if config.has_option(section, 'max distance'):
+        kwargs['max_distance'] = config.getfloat(section, 'max distance')
+    return CheckpointCache(folder, restart_step, **kwargs)
@@ -19,13 +19,140 @@ def kinematic_cost_function(u_FEM, u_DIC, weights=None):
     float
         Cost function
     """
-    delta_u = u_DIC-u_FEM[:, :2]
+    if weights is not None:
+        weights = weights[np.newaxis]
+    return batch_kinematic_cost_function(u_FEM[np.newaxis, np.newaxis], u_DIC[np.newaxis], weights=weights)[0, 0]
+
+
+def pad_steps(arrays):
+    """
+    Stack arrays of different lengths (e.g. DIC measurements at each step) along a new first axis. The missing values
+    are filled with NaN.
+
+    Parameters
+    ----------
+    arrays : list of numpy.ndarray
+        Arrays to stack. They must only differ by their first dimension.
+
+    Returns
+    -------
+    numpy.ndarray
+        Stacked arrays, of shape (len(arrays), max_length, ...)
+    numpy.ndarray
+        Array of bools, of shape (len(arrays), max_length), indicating which values are actual ones
+    """
+    max_length = max(len(a) for a in arrays)
+    stacked = np.full((len(arrays), max_length) + np.shape(arrays[0])[1:], np.nan)
+    mask = np.zeros((len(arrays), max_length), dtype=bool)
+    for i, a in enumerate(arrays):
+        stacked[i, :len(a)] = a
+        mask[i, :len(a)] = True
+    return stacked, mask
+
+
+def _inverse_weights(weights, mask, shape):
+    # Weights of each DIC point (inverse of correlation coefficients), set to zero where the mask is False
     if weights is None:
-        weights=np.ones(len(delta_u))
+        w = np.ones(shape)
     else:
-        weights=1/weights
-    K = np.dot(np.sum(u_DIC**2, axis=1), weights)
-    return np.dot(weights, np.sum(delta_u**2, axis=1))/K    
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w = np.broadcast_to(1 / weights, shape)
+    if mask is None:
+        return w
+    return np.where(mask, w, 0.)
+
+
+def kinematic_normalization(u_DIC, weights=None, mask=None):
+    """
+    Compute the normalization factors of the kinematic cost functions of each step (see
+    batch_kinematic_cost_function). They only depend on the DIC measurements, so they can be computed once for many
+    simulations.
+
+    Parameters
+    ----------
+    u_DIC : numpy.ndarray
+        Array of shape (n_steps, n_points, 2) of displacements given by DIC measurements
+    weights : numpy.ndarray, optional
+        Array of shape (n_steps, n_points) of correlation coefficients. The default is None (no weighting).
+    mask : numpy.ndarray, optional
+        Array of bools, broadcastable to (n_sims, n_steps, n_points), indicating which points are used. The default
+        is None (all points are used).
+
+    Returns
+    -------
+    numpy.ndarray
+        Normalization factors, of shape (n_steps,) or (n_sims, n_steps), depending on the shape of the mask
+    """
+    norm2 = np.sum(u_DIC ** 2, axis=-1)
+    if mask is not None:
+        norm2 = np.where(mask, norm2, 0.)
+    return np.sum(_inverse_weights(weights, mask, norm2.shape) * norm2, axis=-1)
+
+
+def batch_kinematic_cost_function(u_FEM, u_DIC, weights=None, mask=None, K=None):
+    """
+    Compute the kinematic cost functions of many simulations and steps at once.
+
+    Parameters
+    ----------
+    u_FEM : numpy.ndarray
+        Array of shape (n_sims, n_steps, n_points, 2) (or with 3 components) of displacements given by FEM results, at
+        DIC points
+    u_DIC : numpy.ndarray
+        Array of shape (n_steps, n_points, 2) of displacements given by DIC measurements, shared by all the simulations
+    weights : numpy.ndarray, optional
+        Array of shape (n_steps, n_points) of correlation coefficients. The displacement errors are weighted by their
+        inverses. The default is None (no weighting).
+    mask : numpy.ndarray, optional
+        Array of bools, broadcastable to (n_sims, n_steps, n_points), indicating which points are used (e.g. to skip
+        padded values or DIC points outside the mesh). The default is None (all points are used).
+    K : numpy.ndarray, optional
+        Normalization factors, as given by kinematic_normalization. If None (default), they are computed from u_DIC.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (n_sims, n_steps) of cost functions. The kinematic cost function of each simulation is the mean
+        over the steps.
+    """
+    shape = u_FEM.shape[:-1]
+    w = _inverse_weights(weights, mask, shape)
+    delta_u2 = np.sum((u_DIC - u_FEM[..., :2]) ** 2, axis=-1)
+    if mask is not None:
+        delta_u2 = np.where(mask, delta_u2, 0.)
+    if K is None:
+        K = kinematic_normalization(u_DIC, weights=weights, mask=mask)
+    return np.sum(w * delta_u2, axis=-1) / K
+
+
+def kinematic_cost_terms(u_FEM, u_DIC, weights=None):
+    """
+    Compute the numerator and the denominator (normalization factor) of the kinematic cost function. Since both are
+    sums over the DIC points, the cost function of a large dataset can be computed chunk by chunk, by accumulating
+    these terms.
+
+    Parameters
+    ----------
+    u_FEM : numpy.ndarray
+        Array of displacements given by FEM results, at DIC points
+    u_DIC : numpy.ndarray
+        Array of displacements given by DIC measurements
+    weights : numpy.ndarray, optional
+        Correlation coefficients. The displacement errors are weighted by their inverses. The default is None (no
+        weighting).
+
+    Returns
+    -------
+    float
+        Weighted sum of the squared displacement errors
+    float
+        Weighted sum of the squared measured displacements
+    """
+    w = 1 / weights if weights is not None else 1.
+    numerator = np.sum(w * np.sum((u_DIC - u_FEM[:, :2]) ** 2, axis=1))
+    K = np.sum(w * np.sum(u_DIC ** 2, axis=1))
+    return numerator, K
+
 
 def static_cost_function(eps_exp, sigma_exp, eps_FEM, sigma_FEM):
     """
@@ -48,10 +175,159 @@ def static_cost_function(eps_exp, sigma_exp, eps_FEM, sigma_FEM):
         Cost function
 
     """
-    sigma_exp_interp = np.interp(eps_FEM, eps_exp, sigma_exp)
-    K = np.sum(sigma_exp_interp**2)
-    delta_sigma = sigma_FEM-sigma_exp_interp
-    return np.sum(delta_sigma**2)/K
+    eps_FEM = np.asarray(eps_FEM, dtype=float)[np.newaxis]
+    sigma_FEM = np.asarray(sigma_FEM, dtype=float)[np.newaxis]
+    return batch_static_cost_function(eps_exp, sigma_exp, eps_FEM, sigma_FEM)[0]
+
+
+def batch_static_cost_function(eps_exp, sigma_exp, eps_FEM, sigma_FEM, mask=None):
+    """
+    Compute the static cost functions of many simulations at once. If many evaluations are compared against the same
+    experimental curve, build a TensileCurve once and use its cost() method instead.
+
+    Parameters
+    ----------
+    eps_exp : numpy.ndarray
+        Elongation measured experimentally
+    sigma_exp : numpy.ndarray
+        True stress measured experimentally
+    eps_FEM : numpy.ndarray
+        Array of shape (n_sims, n_increments) of simulated elongations (see pad_steps for curves of different lengths)
+    sigma_FEM : numpy.ndarray
+        Array of shape (n_sims, n_increments) of simulated tensile stresses
+    mask : numpy.ndarray, optional
+        Array of bools, of shape (n_sims, n_increments), indicating which increments are used. The default is None
+        (all increments are used).
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of length n_sims of cost functions
+    """
+    return TensileCurve(eps_exp, sigma_exp).cost(eps_FEM, sigma_FEM, mask=mask)
+
+
+class TensileCurve:
+    """
+    Experimental tensile curve, prepared once for being compared against many simulated curves: the points are sorted
+    by elongation (the stresses measured at the same elongation are averaged) and the slopes between them are
+    precomputed, so that the curve can be evaluated with a single lookup per simulated point.
+
+    Parameters
+    ----------
+    eps_exp : numpy.ndarray
+        Elongation measured experimentally
+    sigma_exp : numpy.ndarray
+        True stress measured experimentally
+    resampling : int, optional
+        If given, the curve is resampled onto this number of evenly spaced elongations. Then, the lookups do not need
+        any search. The default is None (the measured points are kept).
+    metric : str, optional
+        Metric used for comparing the curves: 'pointwise' (default) sums the squared errors over the simulated
+        increments, whereas 'integral' integrates them over the simulated elongation (trapezoidal rule), so that the
+        result does not depend on the density of simulated points.
+    """
+
+    def __init__(self, eps_exp, sigma_exp, resampling=None, metric='pointwise'):
+        if metric not in ('pointwise', 'integral'):
+            raise ValueError('Unknown metric "{}". It must be "pointwise" or "integral".'.format(metric))
+        self.metric = metric
+        eps_exp = np.asarray(eps_exp, dtype=float)
+        sigma_exp = np.asarray(sigma_exp, dtype=float)
+        eps, inverse, counts = np.unique(eps_exp, return_inverse=True, return_counts=True)
+        sigma = np.bincount(inverse.ravel(), weights=sigma_exp) / counts
+        if resampling is not None:
+            eps_grid = np.linspace(eps[0], eps[-1], int(resampling))
+            sigma = np.interp(eps_grid, eps, sigma)
+            eps = eps_grid
+        self.eps = eps
+        self.sigma = sigma
+        self.uniform = resampling is not None and len(eps) > 1
+        if len(eps) > 1:
+            self.slopes = np.diff(sigma) / np.diff(eps)
+        else:
+            self.slopes = np.zeros(0)
+        self._last_lookup = (None, None)
+
+    def _interval_ids(self, eps_FEM):
+        # Index of the interval containing each point. The ids of the last call are reused if the elongations are the
+        # same (e.g. when the simulated curves are sampled at the same elongations).
+        last_eps, last_ids = self._last_lookup  # Read once, since the curve may be shared by several threads
+        if last_eps is not None and np.array_equal(eps_FEM, last_eps, equal_nan=True):
+            return last_ids
+        if self.uniform:
+            step = self.eps[1] - self.eps[0]
+            ids = np.floor((np.nan_to_num(eps_FEM, nan=self.eps[0]) - self.eps[0]) / step)
+            ids = np.clip(ids, 0, len(self.slopes) - 1).astype(int)
+        else:
+            ids = np.clip(np.searchsorted(self.eps, eps_FEM, side='right') - 1, 0, len(self.slopes) - 1)
+        self._last_lookup = (np.array(eps_FEM, copy=True), ids)
+        return ids
+
+    def __call__(self, eps_FEM):
+        """
+        Evaluate the experimental stress at given elongations, by linear interpolation (constant extrapolation, as
+        numpy.interp does).
+
+        Parameters
+        ----------
+        eps_FEM : numpy.ndarray
+            Array of elongations, of any shape
+
+        Returns
+        -------
+        numpy.ndarray
+            Experimental stresses, with the same shape as eps_FEM
+        """
+        eps_FEM = np.asarray(eps_FEM, dtype=float)
+        if len(self.eps) == 1:
+            return np.full(eps_FEM.shape, self.sigma[0])
+        ids = self._interval_ids(eps_FEM)
+        sigma = self.sigma[ids] + self.slopes[ids] * (eps_FEM - self.eps[ids])
+        sigma = np.where(eps_FEM <= self.eps[0], self.sigma[0], sigma)
+        return np.where(eps_FEM >= self.eps[-1], self.sigma[-1], sigma)
+
+    def cost(self, eps_FEM, sigma_FEM, mask=None):
+        """
+        Compute the static cost functions of one or many simulated curves.
+
+        Parameters
+        ----------
+        eps_FEM : numpy.ndarray
+            Simulated elongations, of length n_increments or of shape (n_sims, n_increments)
+        sigma_FEM : numpy.ndarray
+            Simulated tensile stresses, with the same shape as eps_FEM
+        mask : numpy.ndarray, optional
+            Array of bools, with the same shape as eps_FEM, indicating which increments are used. The default is None
+            (all increments are used).
+
+        Returns
+        -------
+        float or numpy.ndarray
+            Cost function, or array of length n_sims of cost functions
+        """
+        eps_FEM = np.asarray(eps_FEM, dtype=float)
+        sigma_FEM = np.asarray(sigma_FEM, dtype=float)
+        if mask is not None:
+            eps_FEM = np.where(mask, eps_FEM, np.nan)
+        sigma_exp_interp = self(eps_FEM)
+        delta_sigma2 = (sigma_FEM - sigma_exp_interp) ** 2
+        sigma_exp_interp2 = sigma_exp_interp ** 2
+        if self.metric == 'integral':
+            # Trapezoidal rule, only over the intervals whose both ends are used
+            d_eps = np.diff(eps_FEM, axis=-1)
+            valid = np.isfinite(d_eps)
+            if mask is not None:
+                valid &= mask[..., 1:] & mask[..., :-1]
+            d_eps = np.where(valid, d_eps, 0.)
+            delta_sigma2 = np.where(valid, (delta_sigma2[..., 1:] + delta_sigma2[..., :-1]) / 2, 0.) * d_eps
+            sigma_exp_interp2 = np.where(valid, (sigma_exp_interp2[..., 1:] + sigma_exp_interp2[..., :-1]) / 2,
+                                         0.) * d_eps
+        elif mask is not None:
+            delta_sigma2 = np.where(mask, delta_sigma2, 0.)
+            sigma_exp_interp2 = np.where(mask, sigma_exp_interp2, 0.)
+        return np.sum(delta_sigma2, axis=-1) / np.sum(sigma_exp_interp2, axis=-1)
+
 
 def weighted_cost_function(f1, f2, w1=0.5):
     """
@@ -0,0 +1,269 @@
+import json
+import os
+import shutil
+import threading
+from contextlib import ExitStack, contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    FAST_ENGINE = 'pyarrow'
+except ImportError:
+    FAST_ENGINE = 'c'
+
+# Columns of the QuadratureOutputs*.csv files written by PRISMS-Plasticity, and their indices
+QUADRATURE_COLUMNS = {'grainID': 0, 'x': 4, 'y': 5, 'z': 6, 'rodx': 7, 'rody': 8, 'rodz': 9}
+
+# File describing the source file of a sidecar cache
+SIDECAR_INFO = 'source.json'
+
+
+@contextmanager
+def atomic_write(file_path):
+    """
+    Write a file under a temporary name, in the same folder, then rename it, so that concurrent processes never read
+    incomplete files. The temporary file is removed if writing fails.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the file to write
+
+    Yields
+    ------
+    str
+        Path to the temporary file to write. It has the same extension as the final file (e.g. '.npy' for numpy.save).
+    """
+    root, ext = os.path.splitext(file_path)
+    tmp_file = '{}.{}-{}.tmp{}'.format(root, os.getpid(), threading.get_ident(), ext)
+    try:
+        yield tmp_file
+        os.replace(tmp_file, file_path)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def sidecar_folder(file_path):
+    """Return the folder where the columns of a text file are cached in binary format."""
+    return file_path + '.columns'
+
+
+def _source_info(file_path):
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _read_sidecar(file_path, columns):
+    # Return the cached columns (memory-mapped), or None if the cache is missing, stale or incomplete
+    folder = sidecar_folder(file_path)
+    try:
+        with open(os.path.join(folder, SIDECAR_INFO)) as f:
+            if json.load(f) != _source_info(file_path):
+                return None
+        return {column: np.load(os.path.join(folder, column + '.npy'), mmap_mode='r') for column in columns}
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_sidecar(file_path, read_options, columns, chunk_size):
+    # Stream columns into the cache, and yield the chunks as they are written, so that the whole table is never loaded
+    # into memory. The cache is cleared if the source file has changed.
+    folder = sidecar_folder(file_path)
+    info = _source_info(file_path)
+    info_file = os.path.join(folder, SIDECAR_INFO)
+    try:
+        with open(info_file) as f:
+            up_to_date = json.load(f) == info
+    except (FileNotFoundError, ValueError):
+        up_to_date = False
+    if not up_to_date:
+        shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder, exist_ok=True)
+
+    # First pass to get the number of rows, only parsing one column
+    n_rows = 0
+    count_options = dict(read_options, usecols=read_options['usecols'][:1], names=read_options['names'][:1])
+    for chunk in pd.read_csv(file_path, chunksize=chunk_size, **count_options):
+        n_rows += len(chunk)
+
+    with ExitStack() as stack:
+        arrays = {}
+        for column in columns:
+            tmp_file = stack.enter_context(atomic_write(os.path.join(folder, column + '.npy')))
+            arrays[column] = np.lib.format.open_memmap(tmp_file, mode='w+', dtype=float, shape=(n_rows,))
+        start = 0
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size, **read_options):
+            for column in columns:
+                arrays[column][start:start + len(chunk)] = chunk[column].to_numpy()
+            start += len(chunk)
+            yield chunk
+        for array in arrays.values():
+            array.flush()
+        del arrays
+    with atomic_write(info_file) as tmp_file:
+        with open(tmp_file, 'w') as f:
+            json.dump(info, f)
+
+
+def _surface_filter(chunks, surface):
+    # Only keep the rows where the given column reaches its maximum, while streaming the chunks. The rows kept so far
+    # are dropped as soon as a larger value is found.
+    kept = []
+    z_max = -np.inf
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        z_chunk = chunk[surface].max()
+        if z_chunk > z_max:
+            z_max = z_chunk
+            kept = []
+        if z_chunk == z_max:
+            kept.append(chunk[chunk[surface] == z_max])
+    return kept
+
+
+def read_table(file_path, columns=None, sep=',', names=None, surface=None, cache=False, chunk_size=1000000,
+               engine='c', nrows=None):
+    """
+    Read numeric columns from a text table, only parsing the requested ones.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to text file
+    columns : list of str, optional
+        Names of the columns to read. The default is None (all columns).
+    sep : str, optional
+        Column separator. The default is ','.
+    names : dict, optional
+        Indices of the columns, indexed by their names, for files without header line. The default is None (the names
+        are read from the first line).
+    surface : str, optional
+        If given, only the rows where this column reaches its maximum value are kept (e.g. 'z' for the points on the
+        top surface). The file is then read by chunks, so that the other rows are skipped while streaming.
+    cache : bool, optional
+        If True, the columns are cached in binary format (one .npy file per column, in a sidecar folder next to the
+        text file) at first read, by chunks; they are then memory-mapped from the cache, as long as the text file does
+        not change. The default is False.
+    chunk_size : int, optional
+        Number of lines per chunk when filtering the surface or filling the cache. The default is 1000000.
+    engine : str, optional
+        Parser engine used by pandas.read_csv ('c' or 'pyarrow') when the file is read at once. The default is 'c'.
+        The pyarrow engine is faster for large files, but it does not support reading by chunks and incomplete lines.
+    nrows : int, optional
+        Number of rows to read (without cache). The default is None (all rows).
+
+    Returns
+    -------
+    pandas.DataFrame
+        Requested columns
+    """
+    if names is None:
+        with open(file_path) as f:
+            header = f.readline().rstrip('\r\n')
+        if not header:
+            raise pd.errors.EmptyDataError('No columns to parse from {}.'.format(file_path))
+        header = header.split(sep)
+        names = {name.strip(): i for i, name in enumerate(header)}
+        skiprows = 1
+    else:
+        skiprows = 0
+    if columns is None:
+        columns = list(names.keys())
+    missing = [column for column in columns if column not in names]
+    if missing:
+        raise KeyError('Column(s) {} not found in {}.'.format(', '.join(missing), file_path))
+    to_read = list(columns) if surface is None or surface in columns else list(columns) + [surface]
+
+    if cache:
+        cached = _read_sidecar(file_path, to_read)
+        if cached is not None:
+            if surface is not None:
+                on_surface = cached[surface] == np.max(cached[surface])
+                return pd.DataFrame({column: cached[column][on_surface] for column in columns})
+            return pd.DataFrame({column: np.asarray(cached[column]) for column in columns})
+
+    # Sort the columns by index, as pandas does when selecting columns
+    to_read.sort(key=lambda column: names[column])
+    read_options = dict(sep=sep, header=None, skiprows=skiprows, usecols=[names[column] for column in to_read],
+                        names=to_read, dtype=float)
+    if nrows is not None:
+        read_options['nrows'] = nrows
+    if cache:
+        # The whole columns are cached, so that the surface filter can be applied again on the cache
+        chunks = _write_sidecar(file_path, read_options, to_read, chunk_size)
+        if surface is None:
+            for _ in chunks:
+                pass
+            folder = sidecar_folder(file_path)
+            return pd.DataFrame({column: np.load(os.path.join(folder, column + '.npy'), mmap_mode='r')
+                                 for column in columns})
+    elif surface is not None:
+        chunks = pd.read_csv(file_path, chunksize=chunk_size, **read_options)
+    if surface is not None:
+        kept = _surface_filter(chunks, surface)
+        table = pd.concat(kept) if kept else pd.DataFrame(columns=to_read, dtype=float)
+    else:
+        table = pd.read_csv(file_path, engine=engine, **read_options)
+    return table[list(columns)].reset_index(drop=True)
+
+
+def read_stressstrain(file_path, columns=None, cache=False, complete_lines_only=False):
+    """
+    Read the stressstrain.txt file written by PRISMS-Plasticity.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to stressstrain.txt file
+    columns : list of str, optional
+        Names of the columns to read (e.g. ['Exx', 'Txx']). The default is None (all columns).
+    cache : bool, optional
+        If True, the columns are cached in binary format (see read_table). It should only be enabled once the
+        simulation is over. The default is False.
+    complete_lines_only : bool, optional
+        If True, the last line is skipped unless it ends with a newline (e.g. if the file is being written, its last
+        line may be cut inside a number). The default is False.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Requested columns
+    """
+    nrows = None
+    if complete_lines_only:
+        with open(file_path, 'rb') as f:
+            nrows = max(f.read().count(b'\n') - 1, 0)  # Without the header line
+    # The file may be still being written, so its last line may be incomplete: the pyarrow engine cannot be used
+    return read_table(file_path, columns=columns, sep='\t', cache=cache, nrows=nrows)
+
+
+def read_quadrature(file_path, columns=None, surface_only=False, cache=True, chunk_size=1000000):
+    """
+    Read a QuadratureOutputs*.csv file written by PRISMS-Plasticity (grain ID, location and Rodrigues vector at each
+    quadrature point).
+
+    Parameters
+    ----------
+    file_path : str
+        Path to CSV file
+    columns : list of str, optional
+        Names of the columns to read (see QUADRATURE_COLUMNS). The default is None (all of them).
+    surface_only : bool, optional
+        If True, only the quadrature points on the top surface (z == z_max) are kept. The default is False.
+    cache : bool, optional
+        If True (default), the columns are cached in binary format at first read (see read_table), so that the
+        following analyses do not parse the CSV file again.
+    chunk_size : int, optional
+        Number of lines per chunk when filtering the surface without cache. The default is 1000000.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Requested columns
+    """
+    return read_table(file_path, columns=columns, names=QUADRATURE_COLUMNS, surface='z' if surface_only else None,
+                      cache=cache, chunk_size=chunk_size, engine=FAST_ENGINE)
@@ -1,17 +1,15 @@
 from triangulate import project_orientation
 import numpy as np
 import pandas as pd
+from io_utils import read_quadrature
 from orix.quaternion import symmetry
 from orix.quaternion.orientation import Orientation
 from vtk_utils import create_vtu_from_field
+from orientation_utils import misorientation_field
 
 s = symmetry.Oh
 fpath = '../example/2.0_150.0_20.0_150.0_3.0/QuadratureOutputs1999.csv'
-col_ids=(0,4,5,6,7,8,9)
-col_names=('grainID', 'x', 'y', 'z', 'rodx', 'rody', 'rodz')
-quadrature =pd.read_csv(fpath, header=None, usecols=col_ids, names=col_names)
-z_max=np.max(quadrature['z'])
-quadrature_surf = quadrature[quadrature['z']==z_max]
+quadrature_surf = read_quadrature(fpath, columns=['x', 'y', 'rodx', 'rody', 'rodz'], surface_only=True)
 
 rodrigues = quadrature_surf[['rodx', 'rody', 'rodz']].to_numpy()
 mag = np.sqrt(np.sum(rodrigues ** 2, axis=1))
@@ -30,12 +28,6 @@ xy_ebsd = ebsd_data[['x', 'y']].to_numpy()
 xy_ebsd = xy_ebsd-np.min(xy_ebsd, axis=0)
 o_ebsd = Orientation.from_euler(euler, degrees=True, symmetry=s, direction ='crystal2lab')
 
-downsamp = 5
-xy_ebsd = xy_ebsd[::downsamp]
-o_ebsd = o_ebsd[::downsamp]
-xy = xy[::downsamp]
-o = o[::downsamp]
-
 op = project_orientation(xy_ebsd, o_ebsd, xy)
 #theta = np.ones(shape=xy.shape[0])*np.nan
 #for k, opk in enumerate(op):
@@ -48,12 +40,8 @@ op = project_orientation(xy_ebsd, o_ebsd, xy)
 #xy_clean = xy[not_nan, :]
 #create_vtu_from_field('../example/mesh.vtk', xy_clean, theta_clean, 'misorientation1.vtu', 'Misorientation (deg)')
 
-theta = np.ones(shape=xy.shape[0])*np.nan
-for k, opk in enumerate(op):
-    if not any(np.isnan(opk.data[0])):
-        ok = Orientation((o.data[k],op.data[k]),symmetry=o.symmetry)
-        theta[k] = ok.get_distance_matrix(degrees=True)[0,1]
+theta = misorientation_field(o, op, degrees=True)
 not_nan = np.logical_not(np.isnan(theta))
 theta_clean = theta[not_nan]
 xy_clean = xy[not_nan, :]
-create_vtu_from_field('../example/mesh.vtk', xy_clean, theta_clean, 'misorientation5.vtu', 'Misorientation (deg)')
\ No newline at end of file
+create_vtu_from_field('../example/mesh.vtk', xy_clean, theta_clean, 'misorientation.vtu', 'Misorientation (deg)')
\ No newline at end of file
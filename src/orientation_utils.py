@@ -0,0 +1,71 @@
+import numpy as np
+
+
+def quaternion_product(a, b):
+    """
+    Compute the element-wise Hamilton product of two arrays of quaternions.
+
+    Parameters
+    ----------
+    a : numpy.ndarray
+        n x 4 array of quaternions
+    b : numpy.ndarray
+        n x 4 array of quaternions
+
+    Returns
+    -------
+    numpy.ndarray
+        n x 4 array of quaternions a*b
+    """
+    a0, a1, a2, a3 = np.moveaxis(a, -1, 0)
+    b0, b1, b2, b3 = np.moveaxis(b, -1, 0)
+    return np.stack((a0 * b0 - a1 * b1 - a2 * b2 - a3 * b3,
+                     a0 * b1 + a1 * b0 + a2 * b3 - a3 * b2,
+                     a0 * b2 - a1 * b3 + a2 * b0 + a3 * b1,
+                     a0 * b3 + a1 * b2 - a2 * b1 + a3 * b0), axis=-1)
+
+
+def misorientation_field(o_sim, o_ref, degrees=True, chunk_size=100000):
+    """
+    Compute the disorientation angles between two arrays of orientations, element-wise.
+
+    The misorientations are multiplied by all the (proper) symmetry operators at once; the disorientation angle is
+    given by the largest absolute scalar part of the results.
+
+    Parameters
+    ----------
+    o_sim : orix.quaternion.orientation.Orientation
+        Array of length n of orientations (e.g. simulated ones)
+    o_ref : orix.quaternion.orientation.Orientation
+        Array of length n of reference orientations (e.g. measured ones). Its symmetry is used for both arrays.
+    degrees : bool, optional
+        If True (default), the angles are returned in degrees. Otherwise, they are in radians.
+    chunk_size : int, optional
+        Number of orientations processed at once, in order to limit memory usage. The default is 100000.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of length n of disorientation angles. The angle is NaN if any of the related orientations is NaN.
+    """
+    q_sim = o_sim.data.reshape(-1, 4)
+    q_ref = o_ref.data.reshape(-1, 4)
+    if len(q_sim) != len(q_ref):
+        raise ValueError('Both arrays of orientations must have the same length.')
+    conj = np.array([1., -1., -1., -1.])
+    sym_conj = o_ref.symmetry.proper_subgroup.data * conj
+
+    # Only work with valid orientations
+    valid = np.logical_not(np.any(np.isnan(q_sim), axis=1) | np.any(np.isnan(q_ref), axis=1))
+    ids = np.flatnonzero(valid)
+    theta = np.ones(len(q_sim)) * np.nan
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        m = quaternion_product(q_sim[chunk], q_ref[chunk] * conj)
+
+        # Scalar part of m*S is the dot product between m and the conjugate of S
+        cos_half = np.max(np.abs(m @ sym_conj.T), axis=1)
+        theta[chunk] = 2 * np.arccos(np.clip(cos_half, 0., 1.))
+    if degrees:
+        theta = np.degrees(theta)
+    return theta
@@ -1,12 +1,58 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
 import numpy as np
+from scipy.sparse import csr_matrix
 from scipy.spatial import Delaunay
-from orix.quaternion.orientation import Orientation
-from orix.quaternion import Quaternion
+
+from io_utils import atomic_write
+
+# In-memory cache of projection matrices, shared by all calls within a process
+_projection_cache = OrderedDict()
+max_cached_projections = 64
+
+# In-memory cache of Delaunay triangulations, shared by all calls within a process
+_triangulation_cache = OrderedDict()
+max_cached_triangulations = 4
+
+# Guards both in-memory caches, which are used by the threads processing the DIC steps. The triangulations and
+# projections themselves are computed outside of it
+_cache_lock = threading.Lock()
 
 
-def matrix_projection(nodes, pts):
+def cached_triangulation(nodes):
     """
-    Compute the projection matrix from Delaunay triangulation.
+    Return the Delaunay triangulation of nodes. The last triangulations are kept in memory, so that projections on
+    many sets of points (e.g. chunks of DIC data) only triangulate the mesh once.
+
+    Parameters
+    ----------
+    nodes : numpy.ndarray
+        m x 2 table of node coordinates
+
+    Returns
+    -------
+    scipy.spatial.Delaunay
+        Triangulation of the nodes
+    """
+    key = projection_key(nodes, np.empty((0, 2)))
+    with _cache_lock:
+        if key in _triangulation_cache:
+            _triangulation_cache.move_to_end(key)
+            return _triangulation_cache[key]
+    tri = Delaunay(nodes)
+    with _cache_lock:
+        _triangulation_cache[key] = tri
+        if len(_triangulation_cache) > max_cached_triangulations:
+            _triangulation_cache.popitem(last=False)
+    return tri
+
+
+def barycentric_projection(nodes, pts, tri=None):
+    """
+    Compute the barycentric coordinates of requested points, with respect to the Delaunay triangulation of nodes.
 
     Parameters
     ----------
@@ -14,21 +60,25 @@ def matrix_projection(nodes, pts):
         m x 2 table of node coordinates
     pts : numpy.ndarray
         p x 2 table of coordinates where one wants to evaluate the field
+    tri : scipy.spatial.Delaunay, optional
+        Delaunay triangulation of nodes, if already computed. The default is None.
 
     Returns
     -------
-    mat : numpy.array
-        p x m matrix of projection coefficients. If a requested point is not in a triangle, the corresponding row will
-        be NaN.
-    inside_mesh : numpy.array
-        Array of bools indicating whether the requested points are in the mesh
+    toi : numpy.ndarray
+        q x 3 array of node indices of the triangles containing the points inside the mesh (q<=p)
+    basis_funcs : numpy.ndarray
+        q x 3 array of barycentric weights associated to these nodes
+    inside_mesh : numpy.ndarray
+        Array of bools of length p indicating whether the requested points are in the mesh
     """
     # If only one point is requested, treat it as a 2D array anyway
     if len(np.array(pts).shape)==1:
         pts = pts[np.newaxis, :]
 
     # Perform Delaunay triangulation and find in which triangles the pts belong to
-    tri = Delaunay(nodes)
+    if tri is None:
+        tri = Delaunay(nodes)
     triangle_ids = tri.find_simplex(pts)
     triangles = tri.simplices[triangle_ids]
     inside_mesh = triangle_ids != -1
@@ -51,18 +101,121 @@ def matrix_projection(nodes, pts):
     # Local matrices of basis functions
     phi1 = 1 - np.sum(newp, axis=1, keepdims=True)
     basis_funcs = np.concatenate((phi1, newp), axis=1)
+    return toi, basis_funcs, inside_mesh
+
+
+def matrix_projection(nodes, pts, tri=None):
+    """
+    Compute the projection matrix from Delaunay triangulation.
 
-    # Assemble the global matrix
-    row_indices = np.repeat(np.arange(toi.shape[0]), toi.shape[1])
-    mat_in=np.zeros(shape=(len(toi), len(nodes)))
-    mat_in[row_indices,toi.flatten()]=basis_funcs.flatten()
-    mat = np.ones(shape=(len(pts), len(nodes)))*np.nan
-    mat[inside_mesh, :] = mat_in
+    Parameters
+    ----------
+    nodes : numpy.ndarray
+        m x 2 table of node coordinates
+    pts : numpy.ndarray
+        p x 2 table of coordinates where one wants to evaluate the field
+    tri : scipy.spatial.Delaunay, optional
+        Delaunay triangulation of nodes, if already computed. The default is None.
+
+    Returns
+    -------
+    mat : scipy.sparse.csr_matrix
+        p x m sparse matrix of projection coefficients, with 3 non-zero values per row. If a requested point is not in
+        a triangle, the corresponding row is empty.
+    inside_mesh : numpy.array
+        Array of bools indicating whether the requested points are in the mesh
+    """
+    toi, basis_funcs, inside_mesh = barycentric_projection(nodes, pts, tri=tri)
 
+    # Assemble the global matrix. Rows related to points outside the mesh have no entry.
+    n_per_row = np.zeros(len(inside_mesh), dtype=int)
+    n_per_row[inside_mesh] = toi.shape[1]
+    indptr = np.concatenate(([0], np.cumsum(n_per_row)))
+    mat = csr_matrix((basis_funcs.flatten(), toi.flatten(), indptr), shape=(len(inside_mesh), len(nodes)))
     return mat, inside_mesh
 
 
-def triangular_projection(nodes, vect_field, pts):
+def projection_key(nodes, pts):
+    """
+    Compute a hash identifying a projection operator from node coordinates and requested locations.
+
+    Parameters
+    ----------
+    nodes : numpy.ndarray
+        m x 2 table of node coordinates
+    pts : numpy.ndarray
+        p x 2 table of coordinates where one wants to evaluate the field
+
+    Returns
+    -------
+    str
+        Hexadecimal digest of node coordinates and requested locations
+    """
+    h = hashlib.sha1()
+    for a in (nodes, pts):
+        a = np.ascontiguousarray(a, dtype=float)
+        h.update(str(a.shape).encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+
+def cached_matrix_projection(nodes, pts, cache_dir=None, keep_in_memory=True):
+    """
+    Same as matrix_projection, except that the results are kept in memory (and optionally on disk), so that the
+    projection is only computed once for a given set of nodes and requested locations. The Delaunay triangulation of the
+    nodes is kept in memory too (see cached_triangulation), even if keep_in_memory is False.
+
+    Parameters
+    ----------
+    nodes : numpy.ndarray
+        m x 2 table of node coordinates
+    pts : numpy.ndarray
+        p x 2 table of coordinates where one wants to evaluate the field
+    cache_dir : str, optional
+        Folder where the projection matrices are saved to/loaded from. If None (default), the cache is only kept in
+        memory.
+    keep_in_memory : bool, optional
+        If False, the results are not kept in memory (e.g. for projections on chunks of very large DIC data, which are
+        only cached on disk). The default is True.
+
+    Returns
+    -------
+    mat : scipy.sparse.csr_matrix
+        p x m sparse matrix of projection coefficients (see matrix_projection)
+    inside_mesh : numpy.array
+        Array of bools indicating whether the requested points are in the mesh
+    """
+    key = projection_key(nodes, pts)
+    with _cache_lock:
+        if key in _projection_cache:
+            _projection_cache.move_to_end(key)
+            return _projection_cache[key]
+
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir, key + '.npz')
+    if cache_file is not None and os.path.isfile(cache_file):
+        with np.load(cache_file) as data:
+            mat = csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+            inside_mesh = data['inside_mesh']
+    else:
+        mat, inside_mesh = matrix_projection(nodes, pts, tri=cached_triangulation(nodes))
+        if cache_file is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            with atomic_write(cache_file) as tmp_file:
+                np.savez(tmp_file, data=mat.data, indices=mat.indices, indptr=mat.indptr, shape=mat.shape,
+                         inside_mesh=inside_mesh)
+
+    if not keep_in_memory:
+        return mat, inside_mesh
+    with _cache_lock:
+        _projection_cache[key] = (mat, inside_mesh)
+        if len(_projection_cache) > max_cached_projections:
+            _projection_cache.popitem(last=False)
+    return mat, inside_mesh
+
+
+def triangular_projection(nodes, vect_field, pts, cache=False, cache_dir=None):
     """
     Given a field known at certain nodes in a 2D plane, estimate the field values at other 2D coordinates by triangular
     projection.
@@ -75,6 +228,11 @@ def triangular_projection(nodes, vect_field, pts):
         m x n array defining the n-dimensional vector field at nodes coordinates
     pts : numpy.ndarray
         p x 2 table of coordinates where one wants to evaluate the field
+    cache : bool, optional
+        If True, reuse the projection matrix computed in a previous call with the same nodes and points. The default
+        is False.
+    cache_dir : str, optional
+        Folder where the projection matrices are cached on disk (only used if cache is True). The default is None.
 
     Returns
     -------
@@ -83,15 +241,23 @@ def triangular_projection(nodes, vect_field, pts):
     inside_mesh : numpy.ndarray
         Array of bools indicating whether the requested points are in the mesh
     """
-    mat, inside_mesh = matrix_projection(nodes, pts)
-    return mat.dot(vect_field), inside_mesh
+    if cache:
+        mat, inside_mesh = cached_matrix_projection(nodes, pts, cache_dir=cache_dir)
+    else:
+        mat, inside_mesh = matrix_projection(nodes, pts)
+    u_tri = np.asarray(mat.dot(vect_field), dtype=float)
+    u_tri[~inside_mesh] = np.nan
+    return u_tri, inside_mesh
 
 
-def project_orientation(ebsd_locations, ebsd_orientations, pts):
+def project_orientation(ebsd_locations, ebsd_orientations, pts, chunk_size=100000):
     """
     Given of field of orientations, measured at ebsd locations, compute apply triangular projection of requested
     locations to estimate the local orientation at these points.
 
+    The mean orientation at each point is the largest eigenvector of the weighted sum of q.q^T, where q are the
+    quaternions of the 3 vertices of its parent triangle and the weights are the barycentric coordinates.
+
     Parameters
     ----------
     ebsd_locations : numpy.ndarray
@@ -100,23 +266,44 @@ def project_orientation(ebsd_locations, ebsd_orientations, pts):
         array of length m of measured orientations
     pts : numpy.array
         p x 2 table of coordinates where one wants to projection the orientations
+    chunk_size : int, optional
+        Number of points processed at once, in order to limit memory usage. The default is 100000.
 
     Returns
     -------
     orix.quaternion.orientation.Orientation
         array of length p of projected orientations. The orientation is NaN if the requested point is outside the mesh.
     """
+    # orix is only required for projecting orientations
+    from orix.quaternion.orientation import Orientation
+    from orix.quaternion import Quaternion
+
     if len(np.array(pts).shape)==1:
         pts = pts[np.newaxis, :]
 
-    mat, inside_mesh = matrix_projection(ebsd_locations, pts)
-    mat_red = mat[inside_mesh,:]
+    toi, basis_funcs, inside_mesh = barycentric_projection(ebsd_locations, pts)
     q_mean = np.ones((len(pts),4))*np.nan
     o2 = ebsd_orientations.reduce()
     q = o2.data
-    qq = np.einsum('pi,ij,ik->pjk', mat_red, q, q)
-    w, v = np.linalg.eig(qq)
-    w_max = np.argmax(w, axis=1)
-    q_mean_red = v[np.arange(mat_red.shape[0]), :, w_max]
+    q_mean_red = np.zeros((toi.shape[0], 4))
+    for start in range(0, toi.shape[0], chunk_size):
+        chunk = slice(start, start + chunk_size)
+        w = basis_funcs[chunk]
+        q_toi = q[toi[chunk]]  # Only the 3 vertices of the parent triangles contribute
+
+        # q and -q are the same rotation: put the quaternions of all vertices in the hemisphere of the first one
+        signs = np.where(np.einsum('pki,pi->pk', q_toi, q_toi[:, 0, :]) < 0, -1., 1.)
+        q_toi = q_toi * signs[:, :, np.newaxis]
+
+        # Largest eigenvector of the (symmetric) weighted sum of outer products
+        qq = np.einsum('pk,pki,pkj->pij', w, q_toi, q_toi)
+        _, v = np.linalg.eigh(qq)
+        v_max = v[:, :, -1]
+
+        # Choose the sign of the eigenvector consistently with the weighted mean of the vertices
+        q_avg = np.einsum('pk,pki->pi', w, q_toi)
+        flip = np.sum(v_max * q_avg, axis=1) < 0
+        v_max[flip] = -v_max[flip]
+        q_mean_red[chunk] = v_max
     q_mean[inside_mesh,:] = q_mean_red
     return Orientation(Quaternion(q_mean), ebsd_orientations.symmetry)
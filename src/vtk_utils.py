@@ -1,139 +1,348 @@
+import hashlib
 import numpy as np
 import vtk
 from vtk.util.numpy_support import vtk_to_numpy
 import os
+from concurrent.futures import ThreadPoolExecutor
 from xml.etree.ElementTree import parse
 from vtk.numpy_interface import dataset_adapter as dsa
-from triangulate import triangular_projection
+from scipy.spatial import cKDTree
+from triangulate import projection_key, triangular_projection
 
 
-def read_pvtu(filename):
+def _read_vtu_piece(filename):
+    # Read node coordinates and node displacements from one piece of a pvtu file
+    reader = vtk.vtkXMLUnstructuredGridReader()
+    reader.SetFileName(filename)
+    reader.Update()
+    data = reader.GetOutput()
+    pts_i = vtk_to_numpy(data.GetPoints().GetData())
+    u_i = vtk_to_numpy(data.GetPointData().GetArray(0))
+    return pts_i, u_i
+
+
+def unique_nodes(pts):
+    """
+    Remove duplicated nodes. The nodes are viewed as complex numbers, which is much faster than removing duplicated
+    rows with np.unique(..., axis=0), but gives the same results.
+
+    Parameters
+    ----------
+    pts : np.ndarray
+        m x 2 array of node coordinates
+
+    Returns
+    -------
+    nodes : np.ndarray
+        n x 2 array of unique node coordinates, sorted in lexicographic order
+    idpts : np.ndarray
+        Indices of the first occurrences of the unique nodes in pts
+    """
+    z = np.ascontiguousarray(pts, dtype=float).view(np.complex128).ravel()
+    _, idpts = np.unique(z, return_index=True)
+    return pts[idpts], idpts
+
+
+class SurfaceIndex:
+    """
+    Location of the nodes lying on the surface of interest (z=0) in the pieces of a pvtu file. Since the mesh does not
+    change between simulations, this index is computed once; then the displacements are just gathered by integer
+    indexing.
+
+    Parameters
+    ----------
+    pieces_pts : list of np.ndarray
+        Node coordinates of each piece
+    """
+
+    def __init__(self, pieces_pts):
+        self.n_points = tuple(len(pts_i) for pts_i in pieces_pts)
+        self.local_ids = [np.flatnonzero(pts_i[:, 2] == 0.) for pts_i in pieces_pts]
+        pts = np.concatenate([np.zeros(shape=(0, 2))] +
+                             [pts_i[ids, :2] for pts_i, ids in zip(pieces_pts, self.local_ids)]).astype(float)
+        self.nodes, self.idpts = unique_nodes(pts)
+
+    def gather(self, pieces_u):
+        """
+        Gather the displacements of unique surface nodes from the displacements of each piece.
+
+        Parameters
+        ----------
+        pieces_u : list of np.ndarray
+            Node displacements of each piece
+
+        Returns
+        -------
+        np.ndarray
+            m x 3 array of displacements at the surface nodes
+        """
+        u = np.concatenate([np.zeros(shape=(0, 3))] + [u_i[ids] for u_i, ids in zip(pieces_u, self.local_ids)])
+        return u[self.idpts].astype(float)
+
+
+# Surface indices computed so far, indexed by the numbers of points in each piece and a hash of their coordinates
+_surface_indices = {}
+
+
+def _partition_key(pieces_pts):
+    # Identify a partition by the number of points in each piece, and by the coordinates of these points (different
+    # meshes may have the same number of points in each piece, e.g. specimens of the same topology)
+    h = hashlib.sha1()
+    for pts_i in pieces_pts:
+        h.update(np.ascontiguousarray(pts_i).tobytes())
+    return tuple(len(pts_i) for pts_i in pieces_pts), h.hexdigest()
+
+
+def read_pvtu(filename, max_workers=None):
     """
-    Read node locations and node displacements from parallel vtu files (pvtu)
+    Read node locations and node displacements from parallel vtu files (pvtu). The pieces are read in parallel
+    threads.
+
+    Only the nodes lying at the z=0 plane are considered. Their locations in the pieces are computed at the first
+    call, then reused for any pvtu file with the same partition (i.e. same node coordinates in each piece).
 
     Parameters
     ----------
     filename : str
         Path to pvtu file
+    max_workers : int, optional
+        Maximum number of threads used for reading the pieces. The default is None (see ThreadPoolExecutor).
 
     Returns
     -------
     nodes : np.ndarray
-        m x 3 array of node coordinates. None if the file is not found.
+        m x 2 array of node coordinates. None if the file is not found.
     u   : np.ndarray
         m x 3 array of node displacements. None if the file is not found.
     """
-    reader = vtk.vtkXMLUnstructuredGridReader()
-    pts = np.zeros(shape=(0, 2))
-    u = np.zeros(shape=(0, 3))
-    
     # Retrieve partitions
     if os.path.exists(filename):
         tree = parse(filename)
         root = tree.getroot()
         folder_name, filename = os.path.split(filename)
-        for piece in root[0].iter('Piece'):
-            vtk_file = piece.attrib['Source']
-            # Read individual vtk files
-            reader.SetFileName(os.path.join(folder_name, vtk_file))
-            reader.Update()
-            data = reader.GetOutput()
-            points = data.GetPoints()
-            pts_i = vtk_to_numpy(points.GetData())
-            u_i = vtk_to_numpy(data.GetPointData().GetArray(0))
-            
-            # Remove points at z=0 plane and append data
-            pts = np.concatenate((pts, pts_i[pts_i[:, 2] == 0., :2]))
-            u = np.concatenate((u, u_i[pts_i[:, 2] != 0., :]), axis=0)
-            
-        # Remove duplicates
-        nodes, idpts = np.unique(pts, axis=0, return_index=True)
-        return nodes, u[idpts]
-    
+        vtk_files = [os.path.join(folder_name, piece.attrib['Source']) for piece in root[0].iter('Piece')]
+
+        # Read individual vtk files
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pieces = list(executor.map(_read_vtu_piece, vtk_files))
+
+        # The index is only computed for new partitions
+        key = _partition_key([pts_i for pts_i, _ in pieces])
+        if key not in _surface_indices:
+            _surface_indices[key] = SurfaceIndex([pts_i for pts_i, _ in pieces])
+        index = _surface_indices[key]
+        return index.nodes, index.gather([u_i for _, u_i in pieces])
+
     else:
         # Return None if pvtu is not found
         return None, None
-    
-    
-def merge_displacement_fields(mesh_vtk, input_pvtu, DIC_data, step):
-    # Read mesh file and get node coordinates
-    reader = vtk.vtkGenericDataObjectReader()
-    reader.SetFileName(mesh_vtk)
-    reader.Update()
-    mesh = reader.GetOutput()
-    mesh_new = dsa.WrapDataObject(mesh)
-    points_mesh = vtk_to_numpy(mesh_new.GetPoints())
-    
-    # Only keep nodes at the surface of interest
-    on_surface = points_mesh[:, 2] == 0.
-    point_mesh_surf = points_mesh[on_surface, :2]
-    
+
+
+class MeshSurface:
+    """
+    Mesh read from a vtk file, with its nodes lying on the surface of interest (z=0).
+
+    Parameters
+    ----------
+    mesh_vtk : str
+        Path to mesh file (vtk format)
+    """
+
+    def __init__(self, mesh_vtk):
+        reader = vtk.vtkGenericDataObjectReader()
+        reader.SetFileName(mesh_vtk)
+        reader.Update()
+        self.mesh = reader.GetOutput()
+        self.points = vtk_to_numpy(dsa.WrapDataObject(self.mesh).GetPoints())
+
+        # Only keep nodes at the surface of interest
+        self.on_surface = self.points[:, 2] == 0.
+        self.surface_points = self.points[self.on_surface, :2]
+        self._tree = None
+        self._node_ids = {}
+
+    def node_ids(self, nodes):
+        """
+        Find the mesh nodes matching given nodes of the surface of interest. Nodes in mesh are not ordered the same
+        way as in vtu files, so they are matched by nearest-neighbour search in a KD-tree. The results are cached.
+
+        Parameters
+        ----------
+        nodes : np.ndarray
+            m x 2 array of node coordinates, at the z=0 plane
+
+        Returns
+        -------
+        np.ndarray
+            Array of length m of indices of the related nodes in the mesh
+        """
+        key = projection_key(self.surface_points, nodes)
+        if key not in self._node_ids:
+            if self._tree is None:
+                self._tree = cKDTree(self.points)
+            _, ids = self._tree.query(np.column_stack((nodes, np.zeros(len(nodes)))))
+            self._node_ids[key] = ids
+        return self._node_ids[key]
+
+    def new_output(self):
+        """
+        Return a copy of the mesh, where point data can be added without altering the cached mesh.
+
+        Returns
+        -------
+        vtk.numpy_interface.dataset_adapter.DataObject
+            Wrapped copy of the mesh
+        """
+        mesh_new = self.mesh.NewInstance()
+        mesh_new.ShallowCopy(self.mesh)
+        return dsa.WrapDataObject(mesh_new)
+
+
+# Meshes read so far, indexed by absolute path and modification time
+_meshes = {}
+
+
+def read_mesh(mesh_vtk):
+    """
+    Read a mesh file. The file is only read once, unless it has been modified in the meantime.
+
+    Parameters
+    ----------
+    mesh_vtk : str
+        Path to mesh file (vtk format)
+
+    Returns
+    -------
+    MeshSurface
+        Mesh and its nodes on the surface of interest
+    """
+    key = (os.path.abspath(mesh_vtk), os.path.getmtime(mesh_vtk))
+    if key not in _meshes:
+        _meshes[key] = MeshSurface(mesh_vtk)
+    return _meshes[key]
+
+
+def displacement_error_fields(mesh, nodes, u_sim, pts_dic, u_dic, c):
+    """
+    Map simulated and measured displacements onto the mesh, and compute the displacement error.
+
+    Parameters
+    ----------
+    mesh : MeshSurface
+        Mesh (see read_mesh)
+    nodes : np.ndarray
+        m x 2 array of coordinates of simulated nodes (see read_pvtu)
+    u_sim : np.ndarray
+        m x 3 array of simulated displacements
+    pts_dic : np.ndarray
+        p x 2 array of coordinates of DIC points
+    u_dic : np.ndarray
+        p x 2 array of measured displacements
+    c : np.ndarray
+        Array of length p of correlation coefficients
+
+    Returns
+    -------
+    dict
+        Fields defined at each node of the mesh, sorted by name. They are NaN everywhere, except on the surface of
+        interest.
+    """
+    on_surface = mesh.on_surface
+
     # The displacement will be NaN everywhere, except on the surface of interest
-    n_pts = len(points_mesh)
+    n_pts = len(mesh.points)
     u_sim_tri = np.ones(shape=(n_pts, 3)) * np.nan
-    nodes, u_sim = read_pvtu(input_pvtu)
-    for i in range(0, len(nodes)):
-        # Nodes in mesh are not ordered the same way as in vtu files
-        dist = (points_mesh[:, 0] - nodes[i, 0])**2 + (points_mesh[:, 1] - nodes[i, 1])**2 + points_mesh[:, 2] ** 2
-        egal = np.argmin(dist)
-        u_sim_tri[egal, :] = u_sim[i, :]
-    
-    # Map DIC measurements onto the surface of interest
-    data_dic = np.loadtxt(DIC_data)
-    pts_dic = data_dic[:, :2]
-    u_dic = data_dic[:, (3*step-1):(3*step+1)]
-    u_dic_tri = np.zeros(shape=(n_pts, 3))
-    u_dic_tri[on_surface, :2], _ = triangular_projection(pts_dic, u_dic, point_mesh_surf)
-    u_dic_tri[~on_surface, :] = np.nan
-    
-    # Map correlation coefficients as well
-    c = data_dic[:, 3*step+1]
-    c_tri = np.zeros((n_pts, 1))
-    c_tri[on_surface, :], _ = triangular_projection(pts_dic, c, point_mesh_surf)
-    c_tri[~on_surface, :] = np.nan
-    
+    u_sim_tri[mesh.node_ids(nodes), :] = u_sim
+
+    # Map DIC measurements and correlation coefficients onto the surface of interest
+    u_dic_surf, _ = triangular_projection(pts_dic, np.column_stack((u_dic, c)), mesh.surface_points, cache=True)
+    u_dic_tri = np.ones(shape=(n_pts, 3)) * np.nan
+    u_dic_tri[on_surface, :2] = u_dic_surf[:, :2]
+    u_dic_tri[on_surface, 2] = 0.
+    c_tri = np.ones((n_pts, 1)) * np.nan
+    c_tri[on_surface, 0] = u_dic_surf[:, 2]
+
     # Error function
     delta_u = np.zeros(shape=(n_pts, 3))
     delta_u[:, :2] = u_sim_tri[:, :2] - u_dic_tri[:, :2]
-    
-    # Save displacement fields in vtu file
-    mesh_new.PointData.append(u_sim_tri, "U (FEM)")
-    mesh_new.PointData.append(u_dic_tri, "U (DIC)")
-    mesh_new.PointData.append(delta_u, "Displacement error")
-    mesh_new.PointData.append(c_tri, "Correlation coefficient")
+    return {"U (FEM)": u_sim_tri, "U (DIC)": u_dic_tri, "Displacement error": delta_u,
+            "Correlation coefficient": c_tri}
+
+
+def write_vtu(mesh, fields, output_filename):
+    """
+    Save fields defined on the mesh nodes in a vtu file.
+
+    Parameters
+    ----------
+    mesh : MeshSurface
+        Mesh (see read_mesh)
+    fields : dict
+        Fields to save, sorted by name
+    output_filename : str
+        Path to vtu file
+    """
+    mesh_new = mesh.new_output()
+    for name, field in fields.items():
+        mesh_new.PointData.append(field, name)
     writer = vtk.vtkXMLUnstructuredGridWriter()
-    writer.SetFileName("Displacement_error_{}.vtu".format(step))
+    writer.SetFileName(output_filename)
     writer.SetInputData(mesh_new.VTKObject)
     writer.Write()
 
 
+def merge_displacement_fields(mesh_vtk, input_pvtu, DIC_data, step):
+    # Read mesh file, simulated displacements and DIC measurements
+    mesh = read_mesh(mesh_vtk)
+    nodes, u_sim = read_pvtu(input_pvtu)
+    data_dic = np.loadtxt(DIC_data)
+    pts_dic = data_dic[:, :2]
+    u_dic = data_dic[:, (3*step-1):(3*step+1)]
+    c = data_dic[:, 3*step+1]
+
+    # Save displacement fields in vtu file
+    fields = displacement_error_fields(mesh, nodes, u_sim, pts_dic, u_dic, c)
+    write_vtu(mesh, fields, "Displacement_error_{}.vtu".format(step))
+
+
+def write_pvd(vtu_files, output_filename, time_steps=None):
+    """
+    Write a collection of vtu files as a time series (pvd format).
+
+    Parameters
+    ----------
+    vtu_files : list of str
+        Paths to vtu files, relative to the pvd file
+    output_filename : str
+        Path to pvd file
+    time_steps : list, optional
+        Time step related to each vtu file. The default is None (0, 1, 2 and so on).
+    """
+    if time_steps is None:
+        time_steps = range(len(vtu_files))
+    with open(output_filename, 'w') as f:
+        f.write('<?xml version="1.0"?>\n')
+        f.write('<VTKFile type="Collection" version="0.1">\n')
+        f.write('  <Collection>\n')
+        for time_step, vtu_file in zip(time_steps, vtu_files):
+            f.write('    <DataSet timestep="{}" part="0" file="{}"/>\n'.format(time_step, vtu_file))
+        f.write('  </Collection>\n')
+        f.write('</VTKFile>\n')
+
+
 def create_vtu_from_field(mesh_vtk, locations, field, output_filename, field_name='My field'):
     # Read mesh file and get node coordinates
-    reader = vtk.vtkGenericDataObjectReader()
-    reader.SetFileName(mesh_vtk)
-    reader.Update()
-    mesh = reader.GetOutput()
-    mesh_new = dsa.WrapDataObject(mesh)
-    points_mesh = vtk_to_numpy(mesh_new.GetPoints())
-
-    # Only keep nodes at the surface of interest
-    on_surface = points_mesh[:, 2] == 0.
-    point_mesh_surf = points_mesh[on_surface, :2]
+    mesh = read_mesh(mesh_vtk)
 
     # The field will be NaN everywhere, except on the surface of interest
-    n_pts = len(points_mesh)
+    n_pts = len(mesh.points)
     if len(field.shape) == 1:
         field = field[:, np.newaxis]
     ndim = field.shape[1]
     new_field = np.ones(shape=(n_pts, ndim)) * np.nan
 
-    # Map the given field onto the mesh
-    new_field[on_surface, :], _ = triangular_projection(locations, field, point_mesh_surf)
+    # Map the given field onto the mesh. The projection matrix is reused if the locations are the same.
+    new_field[mesh.on_surface, :], _ = triangular_projection(locations, field, mesh.surface_points, cache=True)
 
     # Save displacement fields in vtu file
-    mesh_new.PointData.append(new_field, field_name)
-    writer = vtk.vtkXMLUnstructuredGridWriter()
-    writer.SetFileName(output_filename)
-    writer.SetInputData(mesh_new.VTKObject)
-    writer.Write()
-    
\ No newline at end of file
+    write_vtu(mesh, {field_name: new_field}, output_filename)
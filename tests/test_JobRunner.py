@@ -0,0 +1,81 @@
+"""
+Check the retries, time limit and cancellation of JobRunner, with FakeBackend standing in for PRISMS-Plasticity.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from JobRunner import CANCELLED, COMPLETED, FAILED, TIMEOUT, FakeBackend, JobBackend, JobRunner  # noqa: E402
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        JobBackend()
+
+
+def test_completed():
+    backend = FakeBackend('prisms')
+    runner = JobRunner(backend, poll_interval=0.01)
+    assert runner.run_all(['a.prm', 'b.prm']) == [COMPLETED, COMPLETED]
+    assert sorted(backend.submitted) == ['prisms a.prm', 'prisms b.prm']
+    assert set(runner.timings) == {'a.prm', 'b.prm'}
+
+
+def test_retries():
+    backend = FakeBackend('prisms', return_code=1)
+    runner = JobRunner(backend, retries=2, poll_interval=0.01)
+    assert runner.submit('a.prm').result() == FAILED
+    assert len(backend.submitted) == 3
+
+
+def test_timeout():
+    backend = FakeBackend('prisms', duration=10.)
+    runner = JobRunner(backend, retries=1, timeout=0.05, poll_interval=0.01)
+    assert runner.submit('a.prm').result() == TIMEOUT
+    # Timed out jobs are resubmitted, and killed each time
+    assert len(backend.submitted) == 2
+    assert backend.cancelled == [0, 1]
+
+
+def test_cancel():
+    backend = FakeBackend('prisms', duration=10.)
+    runner = JobRunner(backend, retries=3, poll_interval=0.01)
+    calls = []
+
+    def monitor():
+        calls.append(None)
+        return len(calls) >= 2
+
+    assert runner.submit('a.prm', monitor=monitor).result() == CANCELLED
+    # Cancelled jobs are not resubmitted
+    assert len(backend.submitted) == 1
+    assert backend.cancelled == [0]
+
+
+def test_failed_submission():
+    class RejectingBackend(FakeBackend):
+        def submit(self, prm_name):
+            super().submit(prm_name)
+            raise OSError('rejected')
+
+    backend = RejectingBackend('sbatch')
+    runner = JobRunner(backend, retries=1, poll_interval=0.01)
+    assert runner.submit('a.prm').result() == FAILED
+    assert len(backend.submitted) == 2
+
+
+def test_failed_monitor():
+    backend = FakeBackend('prisms', duration=10.)
+    runner = JobRunner(backend, poll_interval=0.01)
+
+    def monitor():
+        raise ValueError('could not convert string to float')
+
+    # The job is killed, instead of being left running while the future raises
+    assert runner.submit('a.prm', monitor=monitor).result() == FAILED
+    assert backend.cancelled == [0]